@@ -0,0 +1,28 @@
+"""indexes for keyset pagination of links and collections
+
+Revision ID: 4b5cab995b37
+Revises: d2bd3df423b8
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '4b5cab995b37'
+down_revision: Union[str, None] = 'd2bd3df423b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_links_user_id_created_at_id', 'links', ['user_id', 'created_at', 'id'])
+    op.create_index('ix_collections_user_id_created_at_id', 'collections', ['user_id', 'created_at', 'id'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_collections_user_id_created_at_id', table_name='collections')
+    op.drop_index('ix_links_user_id_created_at_id', table_name='links')
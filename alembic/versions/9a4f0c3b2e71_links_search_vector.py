@@ -0,0 +1,37 @@
+"""full-text search vector over link title and description
+
+Revision ID: 9a4f0c3b2e71
+Revises: 7c1e2a9f5d40
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f0c3b2e71'
+down_revision: Union[str, None] = '7c1e2a9f5d40'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Выражение зафиксировано здесь, а не импортировано из app.models,
+# чтобы миграция не менялась вместе с моделью
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('simple'::regconfig, coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'B')"
+)
+
+
+def upgrade() -> None:
+    # Добавление сохраняемой вычисляемой колонки перезаписывает таблицу links
+    op.add_column('links', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True)))
+    op.create_index('ix_links_search_vector', 'links', ['search_vector'], postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_links_search_vector', table_name='links')
+    op.drop_column('links', 'search_vector')
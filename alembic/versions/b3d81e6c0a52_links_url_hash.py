@@ -0,0 +1,121 @@
+"""canonical link urls and per-user url_hash lookup key
+
+Revision ID: b3d81e6c0a52
+Revises: 9a4f0c3b2e71
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+import hashlib
+from typing import Sequence, Union
+from urllib.parse import urlsplit, urlunsplit
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d81e6c0a52'
+down_revision: Union[str, None] = '9a4f0c3b2e71'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 1000
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def canonicalize_url(url: str) -> str:
+    # Копия app.utils.canonicalize_url на момент миграции
+    if not url:
+        return ""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        # IPv6 адрес: hostname возвращается без квадратных скобок
+        host = f"[{host}]"
+    try:
+        port = parts.port
+    except ValueError:
+        # Некорректный порт: такой URL не загрузится, оставляем его как есть
+        return url.strip()
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        host = f"{userinfo}@{host}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not param.split("=", 1)[0].lower().startswith("utm_")
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def upgrade() -> None:
+    op.add_column('links', sa.Column('url_hash', sa.LargeBinary(), nullable=True))
+    # После канонизации URL разных пользователей (и дубликаты) могут совпасть
+    op.drop_constraint('links_url_key', 'links', type_='unique')
+
+    bind = op.get_bind()
+    # Ссылки обходятся по пользователям, поэтому дубликаты достаточно искать в пределах одного пользователя
+    kept = {}
+    last = (0, 0)
+    while True:
+        rows = bind.execute(
+            sa.text(
+                "SELECT user_id, id, url FROM links WHERE (user_id, id) > (:user_id, :id)"
+                " ORDER BY user_id, id LIMIT :limit"
+            ),
+            {"user_id": last[0], "id": last[1], "limit": BATCH_SIZE},
+        ).all()
+        if not rows:
+            break
+        updates = []
+        duplicates = []
+        for user_id, row_id, url in rows:
+            if user_id != last[0]:
+                kept.clear()
+            last = (user_id, row_id)
+            canonical = canonicalize_url(url)
+            url_hash = hashlib.sha256(canonical.encode()).digest()
+            if url_hash in kept:
+                # После канонизации совпала с более ранней ссылкой пользователя: объединяем их
+                duplicates.append({"id": row_id, "kept_id": kept[url_hash]})
+                continue
+            kept[url_hash] = row_id
+            updates.append({"id": row_id, "url": canonical, "url_hash": url_hash})
+        if updates:
+            bind.execute(sa.text("UPDATE links SET url = :url, url_hash = :url_hash WHERE id = :id"), updates)
+        if duplicates:
+            # Коллекции дубликата переходят к оставшейся ссылке, сам дубликат удаляется
+            # (его строки collection_links удаляются каскадно)
+            bind.execute(
+                sa.text(
+                    "INSERT INTO collection_links (collection_id, link_id)"
+                    " SELECT collection_id, :kept_id FROM collection_links WHERE link_id = :id"
+                    " ON CONFLICT DO NOTHING"
+                ),
+                duplicates,
+            )
+            bind.execute(sa.text("DELETE FROM links WHERE id = :id"), duplicates)
+
+    op.alter_column('links', 'url_hash', nullable=False)
+    op.create_unique_constraint('links_user_id_url_hash_key', 'links', ['user_id', 'url_hash'])
+
+
+def downgrade() -> None:
+    # Объединённые при обновлении дубликаты и исходный вид URL не восстанавливаются.
+    # До миграции URL был уникален среди всех пользователей; если одну ссылку с тех пор
+    # сохранили несколько пользователей, откат невозможен без удаления их данных.
+    bind = op.get_bind()
+    shared = bind.execute(sa.text("SELECT url FROM links GROUP BY url HAVING count(*) > 1 LIMIT 1")).scalar()
+    if shared is not None:
+        raise RuntimeError(
+            f"Откат невозможен: ссылка {shared} сохранена несколькими пользователями, "
+            "а до этой миграции URL должен быть уникален"
+        )
+    op.drop_constraint('links_user_id_url_hash_key', 'links', type_='unique')
+    op.create_unique_constraint('links_url_key', 'links', ['url'])
+    op.drop_column('links', 'url_hash')
@@ -0,0 +1,35 @@
+"""links status for background metadata enrichment
+
+Revision ID: d2bd3df423b8
+Revises: 
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd2bd3df423b8'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('links', sa.Column('status', sa.Text(), server_default=sa.text("'ready'::text"), nullable=False))
+    op.create_check_constraint(
+        'links_status_check',
+        'links',
+        "status = ANY (ARRAY['pending'::text, 'ready'::text, 'failed'::text])",
+    )
+    # Резервирование брошенных ссылок в статусе pending (app.enrichment.claim_query)
+    op.create_index('ix_links_pending', 'links', ['updated_at'], postgresql_where=sa.text("status = 'pending'"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_links_pending', table_name='links')
+    op.drop_constraint('links_status_check', 'links', type_='check')
+    op.drop_column('links', 'status')
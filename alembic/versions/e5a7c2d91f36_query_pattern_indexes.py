@@ -0,0 +1,44 @@
+"""indexes for collection lookups by name, collection_links.link_id and token expiry
+
+Revision ID: e5a7c2d91f36
+Revises: b3d81e6c0a52
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c2d91f36'
+down_revision: Union[str, None] = 'b3d81e6c0a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (имя индекса, таблица, колонки)
+INDEXES = [
+    ('ix_collections_user_id_name', 'collections', ['user_id', 'name']),
+    ('ix_collection_links_link_id', 'collection_links', ['link_id']),
+    ('ix_temp_users_expires_at', 'temp_users', ['expires_at']),
+    ('ix_password_tokens_expires_at', 'password_tokens', ['expires_at']),
+]
+
+
+def upgrade() -> None:
+    # CONCURRENTLY не блокирует запись в таблицы, но не может выполняться внутри транзакции
+    with op.get_context().autocommit_block():
+        tables = sa.inspect(op.get_bind()).get_table_names()
+        for name, table, columns in INDEXES:
+            # temp_users и password_tokens создаются через create_all при старте приложения
+            # вместе с индексами, поэтому их может ещё не быть
+            if table not in tables:
+                continue
+            op.create_index(name, table, columns, postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,189 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import SessionLocal
+from app.models import EmailOutbox
+from app.send_email import build_message, get_smtp_pool, mail_from, mail_password
+
+load_dotenv(dotenv_path='.env')
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 8))
+OUTBOX_RETRY_BASE_DELAY = float(os.getenv("OUTBOX_RETRY_BASE_DELAY", 5))
+OUTBOX_RETRY_MAX_DELAY = float(os.getenv("OUTBOX_RETRY_MAX_DELAY", 600))
+# На это время письмо резервируется за обработчиком; если процесс упадёт, письмо будет отправлено повторно
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", 120))
+
+_worker: Optional[asyncio.Task] = None
+_wakeup: Optional[asyncio.Event] = None
+_stats = {
+    "sent": 0,
+    "retried": 0,
+    "failed": 0,
+}
+# Размер очереди в таблице. Обновляется обработчиком при каждом опросе, чтобы /metrics
+# не обращался к БД: при недоступной БД или исчерпанном пуле метрики нужны больше всего
+_queue_stats = {
+    "queue_depth": 0,
+    "oldest_pending_age_seconds": 0.0,
+    "stats_error": 0,
+}
+_queue_stats_at: Optional[float] = None
+
+
+def enqueue_email(db: AsyncSession, email_to: str, subject: str, body: str, is_html: bool = True):
+    """
+    Добавляет письмо в outbox в текущей транзакции. Письмо будет отправлено
+    фоновым обработчиком только после commit этой транзакции.
+    """
+    db.add(EmailOutbox(email_to=email_to, subject=subject, body=body, is_html=is_html))
+
+
+def wake_outbox_worker():
+    """Будит обработчик, не дожидаясь следующего опроса таблицы."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def start_outbox_worker():
+    global _worker, _wakeup
+    if _worker is not None:
+        return
+    _wakeup = asyncio.Event()
+    _worker = asyncio.create_task(_run())
+
+
+async def stop_outbox_worker():
+    global _worker, _wakeup
+    if _worker is not None:
+        _worker.cancel()
+        await asyncio.gather(_worker, return_exceptions=True)
+    _worker = None
+    _wakeup = None
+
+
+def claim_query():
+    """
+    Резервирует пачку писем, готовых к отправке. SKIP LOCKED позволяет нескольким
+    процессам разбирать очередь параллельно, не блокируя друг друга.
+    """
+    claimable = (
+        select(EmailOutbox.id)
+        .where(EmailOutbox.status == "pending")
+        .where(EmailOutbox.next_attempt_at <= func.now())
+        .order_by(EmailOutbox.next_attempt_at)
+        .limit(OUTBOX_BATCH_SIZE)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(EmailOutbox)
+        .where(EmailOutbox.id.in_(claimable.scalar_subquery()))
+        .values(
+            attempts=EmailOutbox.attempts + 1,
+            next_attempt_at=func.now() + datetime.timedelta(seconds=OUTBOX_LEASE),
+        )
+        .returning(EmailOutbox.id, EmailOutbox.email_to, EmailOutbox.subject, EmailOutbox.body,
+                   EmailOutbox.is_html, EmailOutbox.attempts)
+    )
+
+
+async def _claim_batch() -> list:
+    async with SessionLocal() as db:
+        rows = (await db.execute(claim_query())).all()
+        await db.commit()
+    return rows
+
+
+async def _deliver(row) -> Optional[str]:
+    try:
+        msg = build_message(mail_from, row.email_to, row.subject, row.body, row.is_html)
+        await get_smtp_pool(mail_from, mail_password).send_async(msg)
+        return None
+    except Exception as e:
+        return str(e) or type(e).__name__
+
+
+async def _process_batch(rows: list):
+    errors = await asyncio.gather(*(_deliver(row) for row in rows))
+    async with SessionLocal() as db:
+        sent = [row.id for row, error in zip(rows, errors) if error is None]
+        if sent:
+            # Отправленные письма больше не нужны, таблица содержит только очередь и ошибки
+            await db.execute(delete(EmailOutbox).where(EmailOutbox.id.in_(sent)))
+            _stats["sent"] += len(sent)
+        for row, error in zip(rows, errors):
+            if error is None:
+                continue
+            if row.attempts >= OUTBOX_MAX_ATTEMPTS:
+                logger.warning("Не удалось отправить письмо %s: %s", row.id, error)
+                values = {"status": "failed", "last_error": error}
+                _stats["failed"] += 1
+            else:
+                delay = min(OUTBOX_RETRY_BASE_DELAY * 2 ** (row.attempts - 1), OUTBOX_RETRY_MAX_DELAY)
+                values = {"next_attempt_at": func.now() + datetime.timedelta(seconds=delay), "last_error": error}
+                _stats["retried"] += 1
+            await db.execute(update(EmailOutbox).where(EmailOutbox.id == row.id).values(**values))
+        await db.commit()
+
+
+async def _refresh_queue_stats():
+    global _queue_stats_at
+    try:
+        async with SessionLocal() as db:
+            depth, oldest_age = (await db.execute(text(
+                "SELECT count(*), coalesce(extract(epoch FROM now() - min(created_at)), 0)"
+                " FROM email_outbox WHERE status = 'pending'"
+            ))).one()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        # Остаются прежние значения, stats_error показывает, что они устарели
+        _queue_stats["stats_error"] = 1
+        logger.exception("Не удалось получить размер очереди писем")
+        return
+    _queue_stats.update(queue_depth=depth, oldest_pending_age_seconds=float(oldest_age), stats_error=0)
+    _queue_stats_at = time.monotonic()
+
+
+async def _run():
+    while True:
+        try:
+            rows = await _claim_batch()
+            if rows:
+                await _process_batch(rows)
+                # Пачка была полной: возможно, в очереди есть ещё письма
+                if len(rows) == OUTBOX_BATCH_SIZE:
+                    continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка при обработке очереди писем")
+
+        await _refresh_queue_stats()
+
+        try:
+            await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+
+def get_outbox_stats() -> dict:
+    """Статистика без обращения к БД: размер очереди на момент последнего опроса таблицы."""
+    return {
+        "running": _worker is not None,
+        **_queue_stats,
+        "stats_age_seconds": time.monotonic() - _queue_stats_at if _queue_stats_at is not None else -1,
+        **_stats,
+    }
@@ -3,46 +3,45 @@ from datetime import datetime, timedelta
 from fastapi import HTTPException
 
 from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.email_outbox import enqueue_email, wake_outbox_worker
 from app.models import TempUsers, Users
-from app.database import get_db
-from app.send_email import send_email
 import os
 
 
-def create_temp_user(email: str, password_hash: str):
+async def create_temp_user(db: AsyncSession, email: str, password_hash: str):
     """
     Создает временного пользователя с токеном для подтверждения.
     Удаляет старые записи для данного email.
+    Письмо с подтверждением ставится в outbox в той же транзакции.
     """
-    db = next(get_db())
-    try:
-        db.execute(
-            delete(TempUsers)
-            .where(TempUsers.email == email)
-        )
+    await db.execute(
+        delete(TempUsers)
+        .where(TempUsers.email == email)
+    )
 
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.utcnow() + timedelta(minutes=30)
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(minutes=30)
 
-        temp_user = TempUsers(
-            email=email,
-            password_hash=password_hash,
-            token=token,
-            expires_at=expires_at
-        )
+    temp_user = TempUsers(
+        email=email,
+        password_hash=password_hash,
+        token=token,
+        expires_at=expires_at
+    )
 
-        db.add(temp_user)
-        db.commit()
+    db.add(temp_user)
+    enqueue_email(db, email, *verification_email(token))
+    await db.commit()
+    wake_outbox_worker()
 
-        return token
-    finally:
-        db.close()
+    return token
 
 
-def send_verification_email(email: str, token: str):
+def verification_email(token: str) -> tuple[str, str]:
     """
-    Отправляет email с ссылкой для подтверждения регистрации.
+    Тема и текст письма с ссылкой для подтверждения регистрации.
     """
     verification_url = f"{os.getenv('BASE_URL')}/auth/verify_email?token={token}"
 
@@ -57,36 +56,27 @@ def send_verification_email(email: str, token: str):
         </body>
     </html>
     """
-
-    send_email(
-        email_from=os.getenv("GMAIL"),
-        email_password=os.getenv("GMAILPASSWORD"),
-        email_to=email,
-        subject=subject,
-        body=html_body,
-        is_html=True
-    )
+    return subject, html_body
 
 
-def verify_token_and_register(token: str):
+async def verify_token_and_register(db: AsyncSession, token: str):
     """
     Проверяет токен подтверждения, регистрирует пользователя и удаляет временную запись.
     """
-    db = next(get_db())
     try:
-        temp_user = db.execute(
+        temp_user = (await db.execute(
             select(TempUsers)
             .where(TempUsers.token == token)
             .where(TempUsers.expires_at > datetime.utcnow())
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
 
         if not temp_user:
             raise HTTPException(status_code=400, detail="Токен истек")
 
-        existing_user = db.execute(
+        existing_user = (await db.execute(
             select(Users)
             .where(Users.email == temp_user.email)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
 
         if existing_user:
             raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
@@ -97,12 +87,10 @@ def verify_token_and_register(token: str):
         )
 
         db.add(new_user)
-        db.delete(temp_user)
-        db.commit()
+        await db.delete(temp_user)
+        await db.commit()
 
         return True
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
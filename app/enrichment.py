@@ -0,0 +1,223 @@
+import asyncio
+import datetime
+import logging
+import os
+import time
+from collections import deque
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import select, update
+
+from app.database import SessionLocal
+from app.metadata_cache import metadata_cache
+from app.models import Links
+from app.utils import get_metadata_from_link, canonicalize_url
+
+load_dotenv(dotenv_path='.env')
+
+logger = logging.getLogger(__name__)
+
+ENRICH_WORKERS = int(os.getenv("ENRICH_WORKERS", 4))
+ENRICH_QUEUE_SIZE = int(os.getenv("ENRICH_QUEUE_SIZE", 10000))
+ENRICH_MAX_ATTEMPTS = int(os.getenv("ENRICH_MAX_ATTEMPTS", 5))
+ENRICH_RETRY_BASE_DELAY = float(os.getenv("ENRICH_RETRY_BASE_DELAY", 2))
+ENRICH_RETRY_MAX_DELAY = float(os.getenv("ENRICH_RETRY_MAX_DELAY", 300))
+# Ссылка в статусе pending, которая не обновлялась дольше ENRICH_LEASE, считается брошенной
+# (процесс, создавший её, остановился) и резервируется другим процессом
+ENRICH_LEASE = float(os.getenv("ENRICH_LEASE", 600))
+ENRICH_POLL_INTERVAL = float(os.getenv("ENRICH_POLL_INTERVAL", 60))
+ENRICH_CLAIM_BATCH = int(os.getenv("ENRICH_CLAIM_BATCH", 100))
+# Окно, за которое считается пропускная способность
+THROUGHPUT_WINDOW = 60
+
+_queue: Optional[asyncio.Queue] = None
+_workers: list[asyncio.Task] = []
+_claimer: Optional[asyncio.Task] = None
+_retries: set[asyncio.TimerHandle] = set()
+_completed_at: deque = deque()
+_stats = {
+    "enqueued": 0,
+    "dropped": 0,
+    "in_progress": 0,
+    "succeeded": 0,
+    "retried": 0,
+    "failed": 0,
+}
+
+
+def claim_query(limit: int):
+    """
+    Резервирует брошенные ссылки в статусе pending: updated_at сдвигается на текущее время,
+    поэтому до истечения ENRICH_LEASE ссылку не возьмёт другой процесс. SKIP LOCKED позволяет
+    нескольким процессам резервировать ссылки одновременно, не блокируя друг друга.
+    """
+    now = datetime.datetime.utcnow()
+    claimable = (
+        select(Links.id)
+        .where(Links.status == "pending")
+        .where(Links.updated_at < now - datetime.timedelta(seconds=ENRICH_LEASE))
+        .order_by(Links.updated_at)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Links)
+        .where(Links.id.in_(claimable.scalar_subquery()))
+        .values(updated_at=now)
+        .returning(Links.id, Links.url, Links.updated_at)
+    )
+
+
+async def _claim_links(limit: int) -> list:
+    async with SessionLocal() as db:
+        rows = (await db.execute(claim_query(limit))).all()
+        await db.commit()
+    return rows
+
+
+async def _set_link_metadata(link_id: int, updated_at: datetime.datetime, values: dict):
+    async with SessionLocal() as db:
+        # Обновляем только ссылки, которые всё ещё ждут метаданные и не менялись с постановки
+        # в очередь: иначе перезапишем правку пользователя или ссылку уже зарезервировал другой процесс
+        await db.execute(
+            update(Links)
+            .where(Links.id == link_id)
+            .where(Links.status == "pending")
+            .where(Links.updated_at == updated_at)
+            .values(**values, updated_at=datetime.datetime.utcnow())
+        )
+        await db.commit()
+
+
+async def start_enrichment_workers():
+    """
+    Запускает пул фоновых обработчиков и периодическое резервирование ссылок,
+    оставшихся в статусе pending после остановки другого процесса (или предыдущего запуска).
+    """
+    global _queue, _claimer
+    if _queue is not None:
+        return
+    _queue = asyncio.Queue(maxsize=ENRICH_QUEUE_SIZE)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(ENRICH_WORKERS))
+    _claimer = asyncio.create_task(_claim_abandoned())
+
+
+async def stop_enrichment_workers():
+    global _queue, _claimer
+    if _claimer is not None:
+        _claimer.cancel()
+        await asyncio.gather(_claimer, return_exceptions=True)
+        _claimer = None
+    for handle in _retries:
+        handle.cancel()
+    _retries.clear()
+    for task in _workers:
+        task.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+    _queue = None
+
+
+def enqueue_link(link_id: int, url: str, updated_at: datetime.datetime, attempt: int = 0) -> bool:
+    """
+    Ставит ссылку в очередь на загрузку метаданных. updated_at — значение на момент постановки:
+    метаданные записываются, только если ссылка с тех пор не менялась.
+    Если очередь переполнена, ссылка остаётся в статусе pending, и её зарезервирует
+    _claim_abandoned одного из процессов по истечении ENRICH_LEASE.
+    """
+    if _queue is None:
+        raise RuntimeError("Фоновые обработчики не запущены")
+    try:
+        _queue.put_nowait((link_id, url, updated_at, attempt))
+    except asyncio.QueueFull:
+        _stats["dropped"] += 1
+        return False
+    _stats["enqueued"] += 1
+    return True
+
+
+def _schedule_retry(link_id: int, url: str, updated_at: datetime.datetime, attempt: int):
+    delay = min(ENRICH_RETRY_BASE_DELAY * 2 ** (attempt - 1), ENRICH_RETRY_MAX_DELAY)
+
+    def retry():
+        _retries.discard(handle)
+        if _queue is not None:
+            enqueue_link(link_id, url, updated_at, attempt)
+
+    handle = asyncio.get_running_loop().call_later(delay, retry)
+    _retries.add(handle)
+    _stats["retried"] += 1
+
+
+async def _enrich(link_id: int, url: str, updated_at: datetime.datetime, attempt: int):
+    if attempt:
+        # Иначе повторная попытка получит закэшированную ошибку
+        metadata_cache.invalidate(canonicalize_url(url))
+    try:
+        metadata = await get_metadata_from_link(url)
+    except Exception as e:
+        if attempt + 1 < ENRICH_MAX_ATTEMPTS:
+            _schedule_retry(link_id, url, updated_at, attempt + 1)
+            return
+        logger.warning("Не удалось получить метаданные для ссылки %s: %s", link_id, e)
+        await _set_link_metadata(link_id, updated_at, {"status": "failed"})
+        _stats["failed"] += 1
+        return
+
+    await _set_link_metadata(link_id, updated_at, {
+        "title": metadata["title"],
+        "description": metadata["description"],
+        "image": metadata["image"],
+        "type": metadata["type"],
+        "status": "ready",
+    })
+    _stats["succeeded"] += 1
+
+
+async def _worker():
+    while True:
+        link_id, url, updated_at, attempt = await _queue.get()
+        _stats["in_progress"] += 1
+        try:
+            await _enrich(link_id, url, updated_at, attempt)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Ошибка при обработке ссылки %s", link_id)
+        finally:
+            _stats["in_progress"] -= 1
+            _completed_at.append(time.monotonic())
+            _trim_completed()
+            _queue.task_done()
+
+
+async def _claim_abandoned():
+    while True:
+        try:
+            free = ENRICH_QUEUE_SIZE - _queue.qsize()
+            if free > 0:
+                for link_id, url, updated_at in await _claim_links(min(free, ENRICH_CLAIM_BATCH)):
+                    enqueue_link(link_id, url, updated_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Не удалось зарезервировать ссылки, ожидающие метаданные")
+        await asyncio.sleep(ENRICH_POLL_INTERVAL)
+
+
+def _trim_completed():
+    threshold = time.monotonic() - THROUGHPUT_WINDOW
+    while _completed_at and _completed_at[0] < threshold:
+        _completed_at.popleft()
+
+
+def get_enrichment_stats() -> dict:
+    _trim_completed()
+    return {
+        "workers": len(_workers),
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "scheduled_retries": len(_retries),
+        **_stats,
+        "throughput_per_sec": len(_completed_at) / THROUGHPUT_WINDOW,
+    }
@@ -0,0 +1,113 @@
+import csv
+import datetime
+import io
+import os
+from typing import AsyncIterator, Optional
+
+import orjson
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Select
+
+from app.database import SessionLocal
+
+load_dotenv(dotenv_path='.env')
+
+# Сколько строк читается из курсора БД и отправляется клиенту за раз
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def check_format(format: Optional[str]) -> str:
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Допустимые форматы: {', '.join(EXPORT_FORMATS)}")
+    return format
+
+
+async def _batches(stmt: Select) -> AsyncIterator[list]:
+    """
+    Читает результат запроса пачками через серверный курсор. Сессия создаётся здесь, а не через
+    get_db: зависимость закрывается до того, как StreamingResponse начинает отправлять данные.
+    """
+    async with SessionLocal() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield rows
+
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def _csv_encode(rows: list) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([_csv_value(value) for value in row] for row in rows)
+    return buffer.getvalue().encode()
+
+
+async def _ndjson(stmt: Select, fields: tuple) -> AsyncIterator[bytes]:
+    async for rows in _batches(stmt):
+        yield b"".join(orjson.dumps(dict(zip(fields, row))) + b"\n" for row in rows)
+
+
+async def _csv(stmt: Select, header: tuple) -> AsyncIterator[bytes]:
+    yield _csv_encode([header])
+    async for rows in _batches(stmt):
+        yield _csv_encode(rows)
+
+
+async def _grouped_ndjson(stmt: Select, fields: tuple, group_size: int, nested: str) -> AsyncIterator[bytes]:
+    """
+    NDJSON для запроса, отсортированного по группам: первые group_size колонок описывают группу
+    (коллекцию), остальные — вложенный объект (ссылку). Одна строка вывода на группу;
+    в памяти держится только текущая группа.
+    """
+    group_fields, item_fields = fields[:group_size], fields[group_size:]
+    key = None
+    group = None
+    async for rows in _batches(stmt):
+        lines = []
+        for row in rows:
+            if row[:group_size] != key:
+                if group is not None:
+                    lines.append(orjson.dumps(group) + b"\n")
+                key = row[:group_size]
+                group = dict(zip(group_fields, key), **{nested: []})
+            item = row[group_size:]
+            # LEFT JOIN: у группы без вложенных объектов их поля пустые
+            if any(value is not None for value in item):
+                group[nested].append(dict(zip(item_fields, item)))
+        if lines:
+            yield b"".join(lines)
+    if group is not None:
+        yield orjson.dumps(group) + b"\n"
+
+
+def export_response(stmt: Select, fields: tuple, format: str, filename: str,
+                    grouped: Optional[tuple[int, str]] = None,
+                    csv_header: Optional[tuple] = None) -> StreamingResponse:
+    """
+    Потоковая выгрузка результата запроса. fields — названия колонок stmt по порядку.
+    grouped=(число колонок группы, имя вложенного списка) — в NDJSON строки одной группы
+    собираются в один объект; в CSV выводится каждая строка с заголовком csv_header (по умолчанию fields).
+    """
+    if format == "csv":
+        body = _csv(stmt, csv_header or fields)
+    elif grouped:
+        body = _grouped_ndjson(stmt, fields, *grouped)
+    else:
+        body = _ndjson(stmt, fields)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{format}"'},
+    )
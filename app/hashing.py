@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+from app.utils import hash_password, verify_password
+
+load_dotenv(dotenv_path='.env')
+
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", min(4, os.cpu_count() or 1)))
+# Сколько операций может ждать свободный процесс, сверх уже выполняющихся
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", 32))
+HASH_RETRY_AFTER = int(os.getenv("HASH_RETRY_AFTER", 1))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending = 0
+_stats = {
+    "submitted": 0,
+    "rejected": 0,
+    "completed": 0,
+    "queue_wait_seconds_total": 0.0,
+    "queue_wait_seconds_max": 0.0,
+    "hash_seconds_total": 0.0,
+    "hash_seconds_max": 0.0,
+}
+
+
+class HashingOverloaded(HTTPException):
+    """Очередь на хеширование переполнена, запрос стоит повторить позже."""
+
+    def __init__(self):
+        super().__init__(
+            status_code=503,
+            detail="Сервер перегружен, повторите попытку позже",
+            headers={"Retry-After": str(HASH_RETRY_AFTER)},
+        )
+
+
+def _timed(func, *args):
+    # Выполняется в дочернем процессе: возвращает время начала, чтобы посчитать ожидание в очереди
+    started_at = time.time()
+    started = time.perf_counter()
+    result = func(*args)
+    return result, started_at, time.perf_counter() - started
+
+
+def start_hashing_pool():
+    """
+    Запускает пул процессов для bcrypt. Вызывается при старте приложения.
+    """
+    global _executor
+    if _executor is not None:
+        return
+    # spawn: дочерние процессы не наследуют потоки и event loop приложения
+    _executor = ProcessPoolExecutor(max_workers=HASH_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+def stop_hashing_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+    _executor = None
+
+
+async def _run(func, *args):
+    global _pending
+    if _executor is None:
+        raise RuntimeError("Пул хеширования не запущен")
+    if _pending >= HASH_WORKERS + HASH_MAX_QUEUE:
+        _stats["rejected"] += 1
+        raise HashingOverloaded()
+
+    _pending += 1
+    _stats["submitted"] += 1
+    submitted_at = time.time()
+    try:
+        result, started_at, elapsed = await asyncio.get_running_loop().run_in_executor(_executor, _timed, func, *args)
+    finally:
+        _pending -= 1
+
+    waited = max(started_at - submitted_at, 0.0)
+    _stats["completed"] += 1
+    _stats["queue_wait_seconds_total"] += waited
+    _stats["queue_wait_seconds_max"] = max(_stats["queue_wait_seconds_max"], waited)
+    _stats["hash_seconds_total"] += elapsed
+    _stats["hash_seconds_max"] = max(_stats["hash_seconds_max"], elapsed)
+    return result
+
+
+async def hash_password_async(password: Optional[str]) -> Optional[str]:
+    return await _run(hash_password, password)
+
+
+async def verify_password_async(plain_password: Optional[str], hashed_password: Optional[str]) -> Optional[bool]:
+    return await _run(verify_password, plain_password, hashed_password)
+
+
+def get_hashing_stats() -> dict:
+    completed = _stats["completed"]
+    return {
+        "workers": HASH_WORKERS,
+        "in_flight": _pending,
+        **_stats,
+        "queue_wait_seconds_avg": _stats["queue_wait_seconds_total"] / completed if completed else 0.0,
+        "hash_seconds_avg": _stats["hash_seconds_total"] / completed if completed else 0.0,
+    }
@@ -0,0 +1,108 @@
+import codecs
+import re
+from html.parser import HTMLParser
+from typing import Optional
+
+import httpx
+
+OG_PROPERTIES = ("og:title", "og:description", "og:image", "og:type")
+
+# Сколько первых байт документа просматривается в поисках <meta charset>
+CHARSET_SCAN_BYTES = 8 * 1024
+
+_META_CHARSET_RE = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?\s*([\w.:-]+)""", re.IGNORECASE)
+
+
+class HeadMetadataParser(HTMLParser):
+    """
+    Потоковый парсер <head>: за один проход собирает og:* теги, <title> и meta description.
+    После </head> (или начала <body>) выставляет done, дальше документ можно не читать.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.og: dict[str, str] = {}
+        self.title: Optional[str] = None
+        self.description: Optional[str] = None
+        self.done = False
+        self._title_parts: Optional[list[str]] = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            content = attrs.get("content")
+            if content is None:
+                return
+            prop = (attrs.get("property") or "").lower()
+            if prop in OG_PROPERTIES:
+                self.og.setdefault(prop, content)
+            elif (attrs.get("name") or "").lower() == "description" and self.description is None:
+                self.description = content
+        elif tag == "title" and self.title is None:
+            self._title_parts = []
+        elif tag == "body":
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == "title" and self._title_parts is not None:
+            self.title = "".join(self._title_parts)
+            self._title_parts = None
+        elif tag == "head":
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title_parts is not None:
+            self._title_parts.append(data)
+
+    def finish(self):
+        # Документ мог оборваться внутри <title>
+        if self._title_parts is not None:
+            self.title = "".join(self._title_parts)
+            self._title_parts = None
+
+
+def _meta_charset(head: bytes) -> Optional[str]:
+    match = _META_CHARSET_RE.search(head[:CHARSET_SCAN_BYTES])
+    # Совпадение в самом конце буфера может быть обрезанным названием кодировки
+    if match is None or match.end() >= len(head):
+        return None
+    return match.group(1).decode("ascii", "ignore")
+
+
+def _detect_encoding(response: httpx.Response, head: bytes) -> str:
+    encoding = response.charset_encoding or _meta_charset(head) or "utf-8"
+    try:
+        return codecs.lookup(encoding).name
+    except LookupError:
+        return "utf-8"
+
+
+async def parse_head(response: httpx.Response, max_bytes: int) -> HeadMetadataParser:
+    """
+    Читает тело ответа порциями и разбирает его, пока не закончится <head>
+    или не будет прочитано max_bytes байт.
+    Если кодировки нет в Content-Type, до начала разбора накапливается до CHARSET_SCAN_BYTES
+    байт в поисках <meta charset>: тег может прийти не в первой порции.
+    """
+    parser = HeadMetadataParser()
+    decoder = None
+    buffered = b""
+    received = 0
+    async for chunk in response.aiter_bytes():
+        received += len(chunk)
+        if decoder is None:
+            buffered += chunk
+            if (not response.charset_encoding and _meta_charset(buffered) is None
+                    and len(buffered) < CHARSET_SCAN_BYTES and received < max_bytes):
+                continue
+            decoder = codecs.getincrementaldecoder(_detect_encoding(response, buffered))(errors="replace")
+            chunk, buffered = buffered, b""
+        parser.feed(decoder.decode(chunk))
+        if parser.done or received >= max_bytes:
+            break
+    if decoder is None and buffered:
+        # Документ короче CHARSET_SCAN_BYTES
+        decoder = codecs.getincrementaldecoder(_detect_encoding(response, buffered))(errors="replace")
+        parser.feed(decoder.decode(buffered))
+    parser.finish()
+    return parser
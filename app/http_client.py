@@ -0,0 +1,105 @@
+import asyncio
+import os
+from contextlib import asynccontextmanager
+from typing import Optional
+from urllib.parse import urlsplit
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv(dotenv_path='.env')
+
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 5))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+# Ограничения на количество одновременных загрузок: всего и на один хост
+HTTP_MAX_INFLIGHT = int(os.getenv("HTTP_MAX_INFLIGHT", 50))
+HTTP_MAX_INFLIGHT_PER_HOST = int(os.getenv("HTTP_MAX_INFLIGHT_PER_HOST", 4))
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
+}
+
+_client: Optional[httpx.AsyncClient] = None
+_inflight: Optional[asyncio.Semaphore] = None
+# host -> [семафор, количество ожидающих/выполняющихся запросов]
+_host_slots: dict[str, list] = {}
+
+
+async def start_http_client():
+    """
+    Создаёт общий для приложения HTTP клиент. Вызывается при старте приложения.
+    """
+    global _client, _inflight
+    if _client is not None:
+        return
+    _client = httpx.AsyncClient(
+        headers=DEFAULT_HEADERS,
+        follow_redirects=True,
+        timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+    )
+    _inflight = asyncio.Semaphore(HTTP_MAX_INFLIGHT)
+
+
+async def close_http_client():
+    """
+    Закрывает общий HTTP клиент и его пул соединений. Вызывается при остановке приложения.
+    """
+    global _client, _inflight
+    if _client is not None:
+        await _client.aclose()
+    _client = None
+    _inflight = None
+    _host_slots.clear()
+
+
+def get_http_client() -> httpx.AsyncClient:
+    if _client is None:
+        raise RuntimeError("HTTP клиент не запущен")
+    return _client
+
+
+@asynccontextmanager
+async def _host_slot(host: str):
+    slot = _host_slots.get(host)
+    if slot is None:
+        slot = _host_slots[host] = [asyncio.Semaphore(HTTP_MAX_INFLIGHT_PER_HOST), 0]
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        slot[1] -= 1
+        if slot[1] == 0:
+            del _host_slots[host]
+
+
+@asynccontextmanager
+async def fetch_slot(url: str):
+    """
+    Ограничивает число одновременных загрузок: глобально и для хоста из url.
+    """
+    if _inflight is None:
+        raise RuntimeError("HTTP клиент не запущен")
+    host = (urlsplit(url).hostname or "").lower()
+    async with _host_slot(host):
+        async with _inflight:
+            yield
+
+
+@asynccontextmanager
+async def stream(url: str):
+    """
+    Открывает потоковый GET запрос через общий клиент с учётом ограничений на параллельность.
+    """
+    async with fetch_slot(url):
+        async with get_http_client().stream("GET", url) as response:
+            yield response
@@ -0,0 +1,142 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+
+load_dotenv(dotenv_path='.env')
+
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", 3600))
+METADATA_CACHE_NEGATIVE_TTL = float(os.getenv("METADATA_CACHE_NEGATIVE_TTL", 60))
+METADATA_CACHE_MAX_BYTES = int(os.getenv("METADATA_CACHE_MAX_BYTES", 32 * 1024 * 1024))
+
+# Примерные накладные расходы на одну запись (ключ словаря, кортеж, dict)
+_ENTRY_OVERHEAD = 256
+
+
+def _entry_size(key: str, value) -> int:
+    size = _ENTRY_OVERHEAD + len(key)
+    if isinstance(value, dict):
+        size += sum(len(v) for v in value.values() if isinstance(v, str))
+    else:
+        size += len(str(value.detail))
+    return size
+
+
+class MetadataCache:
+    """
+    Кэш метаданных страниц с LRU вытеснением по объёму памяти.
+
+    Успешные результаты хранятся ttl секунд, ошибки — negative_ttl секунд.
+    Одновременные запросы одного и того же ключа выполняют одну загрузку.
+    """
+
+    def __init__(self, ttl: float, negative_ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_bytes = max_bytes
+        # key -> (expires_at, dict с метаданными или HTTPException, размер)
+        self._entries: "OrderedDict[str, tuple[float, object, int]]" = OrderedDict()
+        self._inflight: dict[str, asyncio.Task] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value, size = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            self._bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key: str, value, ttl: float):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[2]
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value, size)
+        self._bytes += size
+        while self._bytes > self.max_bytes:
+            _, (_, _, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    async def _load(self, key: str, fetcher: Callable[[], Awaitable[dict]]) -> dict:
+        try:
+            value = await fetcher()
+        except HTTPException as e:
+            self._store(key, e, self.negative_ttl)
+            raise
+        else:
+            self._store(key, value, self.ttl)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    async def get_or_fetch(self, key: str, fetcher: Callable[[], Awaitable[dict]]) -> dict:
+        """
+        Возвращает метаданные из кэша или загружает их через fetcher.
+        Ошибки загрузки (HTTPException) тоже кэшируются и выбрасываются повторно.
+        """
+        value = self._lookup(key)
+        if value is not None:
+            if isinstance(value, HTTPException):
+                self.negative_hits += 1
+                raise HTTPException(status_code=value.status_code, detail=value.detail)
+            self.hits += 1
+            return dict(value)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, fetcher))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # shield: отмена одного из ожидающих запросов не прерывает общую загрузку
+        return dict(await asyncio.shield(task))
+
+    def invalidate(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses + self.coalesced
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "inflight": len(self._inflight),
+            "hit_ratio": (self.hits + self.negative_hits + self.coalesced) / lookups if lookups else 0.0,
+        }
+
+
+metadata_cache = MetadataCache(
+    ttl=METADATA_CACHE_TTL,
+    negative_ttl=METADATA_CACHE_NEGATIVE_TTL,
+    max_bytes=METADATA_CACHE_MAX_BYTES,
+)
+
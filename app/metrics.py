@@ -0,0 +1,181 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Optional
+
+# Границы гистограмм задержки, сек
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Гистограмма в формате Prometheus. observe только находит корзину и увеличивает счётчик,
+    накопительные значения считаются при выдаче метрик.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = buckets
+        # labels -> [счётчики по корзинам (последняя — +Inf), сумма]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                extra = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, extra)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+def gauges(name: str, help: str, values: dict, label: Optional[str] = None) -> list[str]:
+    """
+    Значения, которые снимаются в момент запроса /metrics (размеры пулов, очередей и т.п.).
+    values: {значение метки: число} или {"": число} для метрики без меток.
+    """
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+    for key, value in values.items():
+        labels = f'{{{label}="{_escape(key)}"}}' if label else ""
+        lines.append(f"{name}{labels} {float(value)}")
+    return lines
+
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Количество HTTP запросов", ("router", "method", "route", "status"),
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Время обработки HTTP запроса", ("router", "method", "route"),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "Количество SQL запросов за один HTTP запрос", ("router", "method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+DB_QUERIES = Counter("db_queries_total", "Количество SQL запросов, включая фоновые задачи")
+DB_POOL_WAIT = Histogram("db_pool_checkout_wait_seconds", "Ожидание свободного соединения с БД")
+METADATA_FETCH_LATENCY = Histogram(
+    "metadata_fetch_duration_seconds", "Загрузка метаданных страницы (без попаданий в кэш)", ("result",),
+)
+SMTP_SEND_LATENCY = Histogram("smtp_send_duration_seconds", "Отправка письма через SMTP", ("result",))
+
+REGISTRY = (HTTP_REQUESTS, HTTP_LATENCY, DB_QUERIES_PER_REQUEST, DB_QUERIES, DB_POOL_WAIT,
+            METADATA_FETCH_LATENCY, SMTP_SEND_LATENCY)
+
+
+class RequestStats:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = 0
+
+
+# Статистика текущего HTTP запроса; None вне запроса (фоновые задачи)
+request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+
+def count_query(*args):
+    """Обработчик события before_cursor_execute движка БД."""
+    DB_QUERIES.inc()
+    stats = request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: время ответа, статус и количество SQL запросов по маршрутам.
+    Метка route — шаблон пути из роутера, а не фактический URL, чтобы число меток не росло.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = request_stats.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            request_stats.reset(token)
+            route = scope.get("route")
+            if route is not None:
+                tags = getattr(route, "tags", None)
+                labels = (tags[0] if tags else "", scope["method"], route.path)
+            else:
+                labels = ("", scope["method"], "unmatched")
+            HTTP_REQUESTS.inc(*labels, str(status))
+            HTTP_LATENCY.observe(elapsed, *labels)
+            DB_QUERIES_PER_REQUEST.observe(stats.queries, *labels)
+
+
+def render(extra: list[str]) -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    lines.extend(extra)
+    return "\n".join(lines) + "\n"
@@ -1,10 +1,19 @@
 from typing import List, Optional
 
-from sqlalchemy import CheckConstraint, Column, DateTime, ForeignKeyConstraint, Identity, Integer, PrimaryKeyConstraint, \
-    Table, Text, UniqueConstraint, text, ForeignKey, String
+from sqlalchemy import CheckConstraint, Column, Computed, DateTime, ForeignKeyConstraint, Identity, Index, Integer, PrimaryKeyConstraint, \
+    Table, Text, UniqueConstraint, text, ForeignKey, String, Boolean, LargeBinary
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 import datetime
 
+# Конфигурация 'simple' без стемминга: ссылки бывают на любом языке
+LINKS_SEARCH_CONFIG = 'simple'
+LINKS_SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{LINKS_SEARCH_CONFIG}'::regconfig, coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{LINKS_SEARCH_CONFIG}'::regconfig, coalesce(description, '')), 'B')"
+)
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -29,7 +38,9 @@ class Collections(Base):
     __tablename__ = 'collections'
     __table_args__ = (
         ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE', name='fk_user'),
-        PrimaryKeyConstraint('id', name='collections_pkey')
+        PrimaryKeyConstraint('id', name='collections_pkey'),
+        Index('ix_collections_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_collections_user_id_name', 'user_id', 'name')
     )
 
     id: Mapped[int] = mapped_column(Integer, Identity(always=True, start=1, increment=1, minvalue=1, maxvalue=2147483647, cycle=False, cache=1), primary_key=True)
@@ -40,25 +51,35 @@ class Collections(Base):
     updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
 
     user: Mapped['Users'] = relationship('Users', back_populates='collections')
-    links: Mapped[List['Links']] = relationship('Links', secondary='collection_links', back_populates='collections', lazy='selectin')
+    links: Mapped[List['Links']] = relationship('Links', secondary='collection_links', back_populates='collections')
 
 
 class Links(Base):
     __tablename__ = 'links'
     __table_args__ = (
         CheckConstraint("type = ANY (ARRAY['website'::text, 'book'::text, 'article'::text, 'music'::text, 'video'::text])", name='links_type_check'),
+        CheckConstraint("status = ANY (ARRAY['pending'::text, 'ready'::text, 'failed'::text])", name='links_status_check'),
         ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE', name='fk_user'),
         PrimaryKeyConstraint('id', name='links_pkey'),
-        UniqueConstraint('url', name='links_url_key')
+        UniqueConstraint('user_id', 'url_hash', name='links_user_id_url_hash_key'),
+        Index('ix_links_user_id_created_at_id', 'user_id', 'created_at', 'id'),
+        Index('ix_links_search_vector', 'search_vector', postgresql_using='gin'),
+        Index('ix_links_pending', 'updated_at', postgresql_where=text("status = 'pending'"))
     )
 
     id: Mapped[int] = mapped_column(Integer, Identity(always=True, start=1, increment=1, minvalue=1, maxvalue=2147483647, cycle=False, cache=1), primary_key=True)
     user_id: Mapped[int] = mapped_column(Integer)
     title: Mapped[str] = mapped_column(Text)
     url: Mapped[str] = mapped_column(Text)
+    # sha256 канонического url (app.utils.hash_url)
+    url_hash: Mapped[bytes] = mapped_column(LargeBinary)
     description: Mapped[Optional[str]] = mapped_column(Text)
     image: Mapped[Optional[str]] = mapped_column(Text)
     type: Mapped[Optional[str]] = mapped_column(Text, server_default=text("'website'::text"))
+    status: Mapped[str] = mapped_column(Text, server_default=text("'ready'::text"))
+    # Поисковый вектор по заголовку и описанию, поддерживается самой БД.
+    # deferred: в обычных запросах к ссылкам колонка не загружается
+    search_vector: Mapped[Optional[str]] = mapped_column(TSVECTOR, Computed(LINKS_SEARCH_VECTOR, persisted=True), deferred=True)
     created_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
     updated_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
 
@@ -72,7 +93,10 @@ t_collection_links = Table(
     Column('link_id', Integer, primary_key=True, nullable=False),
     ForeignKeyConstraint(['collection_id'], ['collections.id'], ondelete='CASCADE', name='fk_collection'),
     ForeignKeyConstraint(['link_id'], ['links.id'], ondelete='CASCADE', name='fk_link'),
-    PrimaryKeyConstraint('collection_id', 'link_id', name='collection_links_pkey')
+    PrimaryKeyConstraint('collection_id', 'link_id', name='collection_links_pkey'),
+    # Первичный ключ начинается с collection_id и не помогает при поиске по link_id,
+    # в том числе при каскадном удалении ссылки
+    Index('ix_collection_links_link_id', 'link_id')
 )
 
 
@@ -82,7 +106,7 @@ class PasswordResetToken(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     token = Column(String(255), unique=True, index=True)
-    expires_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
     created_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
 
     user = relationship("Users", back_populates="password_reset_tokens")
@@ -95,5 +119,25 @@ class TempUsers(Base):
     email = Column(String, unique=True, index=True)
     password_hash = Column(String)
     token = Column(String, unique=True, index=True)
-    expires_at = Column(DateTime)
+    expires_at = Column(DateTime, index=True)
     created_at = Column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        CheckConstraint("status = ANY (ARRAY['pending'::text, 'failed'::text])", name='email_outbox_status_check'),
+        PrimaryKeyConstraint('id', name='email_outbox_pkey'),
+        Index('ix_email_outbox_pending', 'next_attempt_at', postgresql_where=text("status = 'pending'"))
+    )
+
+    id: Mapped[int] = mapped_column(Integer, Identity(always=True, start=1, increment=1, minvalue=1, maxvalue=2147483647, cycle=False, cache=1), primary_key=True)
+    email_to: Mapped[str] = mapped_column(Text)
+    subject: Mapped[str] = mapped_column(Text)
+    body: Mapped[str] = mapped_column(Text)
+    is_html: Mapped[bool] = mapped_column(Boolean, server_default=text('true'))
+    status: Mapped[str] = mapped_column(Text, server_default=text("'pending'::text"))
+    attempts: Mapped[int] = mapped_column(Integer, server_default=text('0'))
+    last_error: Mapped[Optional[str]] = mapped_column(Text)
+    next_attempt_at: Mapped[datetime.datetime] = mapped_column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
+    created_at: Mapped[Optional[datetime.datetime]] = mapped_column(DateTime, server_default=text('CURRENT_TIMESTAMP'))
@@ -0,0 +1,74 @@
+import base64
+import datetime
+import json
+import os
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import HTTPException
+from sqlalchemy import Select, tuple_
+
+load_dotenv(dotenv_path='.env')
+
+DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", 50))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", 500))
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(created_at: datetime.datetime, row_id: int) -> str:
+    """
+    Кодирует позицию (created_at, id) последней строки страницы в непрозрачную строку.
+    """
+    return _encode([created_at.isoformat(), row_id])
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, int]:
+    try:
+        created_at, row_id = _decode(cursor)
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
+def encode_rank_cursor(rank: float, row_id: int) -> str:
+    """
+    Курсор для выдачи, отсортированной по релевантности: позиция (rank, id).
+    """
+    return _encode([rank, row_id])
+
+
+def decode_rank_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        rank, row_id = _decode(cursor)
+        return float(rank), int(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Неверный курсор")
+
+
+def paginate(stmt: Select, model, cursor: Optional[str], limit: int) -> Select:
+    """
+    Добавляет к запросу keyset пагинацию по (created_at, id): от новых записей к старым.
+    Выбирается limit + 1 строка, чтобы понять, есть ли следующая страница.
+    """
+    if cursor:
+        stmt = stmt.where(tuple_(model.created_at, model.id) < tuple_(*decode_cursor(cursor)))
+    return stmt.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1)
+
+
+def page_items(rows: list, limit: int) -> tuple[list, Optional[str]]:
+    """
+    Отрезает лишнюю строку и возвращает (элементы страницы, курсор следующей страницы).
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
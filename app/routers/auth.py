@@ -5,14 +5,17 @@ from typing import Optional
 from dotenv import load_dotenv
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi import Depends, HTTPException, APIRouter
+from fastapi.concurrency import run_in_threadpool
 from jose import JWTError, jwt
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db, user_exists
-from app.email_verification import send_verification_email, create_temp_user, verify_token_and_register
+from app.email_verification import create_temp_user, verify_token_and_register
+from app.hashing import HashingOverloaded, hash_password_async, verify_password_async
 from app.models import Users
-from app.schemas import UserCreate
-from app.utils import verify_password, hash_password
+from app.schemas import UserCreate, UserIdentity
+from app.user_cache import UserCache
+from app.utils import verify_token_validity, VERIFY_TOKEN_REMOTE
 
 load_dotenv(".env")
 
@@ -27,48 +30,50 @@ router = APIRouter(
 )
 
 
-def register_user(email: str, password: str):
+async def register_user(db: AsyncSession, email: str, password: str):
     """
     Регистрация пользователя с отправкой email для подтверждения.
     """
-    db = next(get_db())
     try:
-        if user_exists(email):
+        if await user_exists(db, email):
             raise HTTPException(status_code=400, detail="Email уже зарегистрирован")
 
-        hashed_password = hash_password(password)
-        token = create_temp_user(email, hashed_password)
-
-        send_verification_email(email, token)
+        hashed_password = await hash_password_async(password)
+        token = await create_temp_user(db, email, hashed_password)
 
         return {"message": "Письмо с подтверждением отправлено. Проверьте вашу почту.", "token": token}
+    except HashingOverloaded:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 
 @router.get("/verify_email")
-def verify_email(token: Optional[str] = ...):
+async def verify_email(token: Optional[str] = ..., db: AsyncSession = Depends(get_db)):
     """
     Подтверждение email по токену.
     """
-    if verify_token_and_register(token):
+    if await verify_token_and_register(db, token):
         return {"message": "Email успешно подтверждён и аккаунт создан"}
     raise HTTPException(status_code=400, detail="Неверный или просроченный токен")
 
 
 @router.post('/register/', response_model=dict)
-def register(user_data: UserCreate):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     """
     Регистрация нового пользователя.
     """
-    return register_user(user_data.email, user_data.password)
+    return await register_user(db, user_data.email, user_data.password)
 
 
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", 10000))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", 300))
+# Запись в кэше не должна жить дольше токена, по которому она была получена
+user_cache = UserCache(ttl=min(USER_CACHE_TTL, ACCESS_TOKEN_EXPIRE_MINUTES * 60), max_size=USER_CACHE_SIZE)
+
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """
@@ -92,12 +97,12 @@ def decode_access_token(token: str):
 
 
 @router.post("/login")
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db)):
     """
     Авторизация пользователя и выдача JWT токена.
     """
-    user = db.query(Users).filter(Users.email == form_data.username).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+    user = (await db.execute(select(Users).where(Users.email == form_data.username))).scalars().first()
+    if not user or not await verify_password_async(form_data.password, user.password_hash):
         raise HTTPException(status_code=400, detail="Неправильный email или пароль")
 
     access_token = create_access_token(
@@ -107,23 +112,47 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
     return {"access_token": access_token, "token_type": "bearer"}
 
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """
-    Получение текущего пользователя по JWT токену.
-    """
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=401,
         detail="Не удалось проверить учётные данные",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+
+def _user_id_from_token(token: str, remote: bool) -> int:
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = int(payload.get("sub"))
-    except (JWTError, ValueError):
-        raise credentials_exception
-
-    stmt = select(Users).where(Users.id == user_id)
-    user = db.execute(stmt).scalar()
-    if user is None:
-        raise credentials_exception
+        return int(verify_token_validity(token, remote=remote)["sub"])
+    except (HTTPException, ValueError):
+        raise _credentials_exception()
+
+
+async def get_current_user_id(token: str = Depends(oauth2_scheme)) -> int:
+    """
+    id текущего пользователя из JWT токена, без обращения к БД.
+    Для обработчиков, которым нужен только user.id.
+    """
+    if VERIFY_TOKEN_REMOTE:
+        # Межсерверная проверка делает синхронный HTTP запрос: выполняем её в пуле потоков,
+        # чтобы не блокировать цикл событий (запрос может идти к /me этого же сервера)
+        return await run_in_threadpool(_user_id_from_token, token, True)
+    return _user_id_from_token(token, remote=False)
+
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserIdentity:
+    """
+    Получение текущего пользователя по JWT токену.
+    Данные пользователя берутся из кэша, в БД идём только при промахе.
+    """
+    # Без межсерверной проверки: она сама обращается к /me, который зависит от get_current_user
+    user_id = _user_id_from_token(token, remote=False)
+    user = user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    row = (await db.execute(select(Users.id, Users.email).where(Users.id == user_id))).first()
+    if row is None:
+        raise _credentials_exception()
+    user = UserIdentity(id=row.id, email=row.email)
+    user_cache.put(user)
     return user
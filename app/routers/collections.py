@@ -1,144 +1,319 @@
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select, delete, insert
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy import ARRAY, Integer, LargeBinary, any_, bindparam, or_, select, delete, insert, func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user_id
 from app.database import get_db
+from app.etag import etag_matches, make_etag, not_modified
+from app.export import check_format, export_response
 from app.models import Links, Collections, t_collection_links
-from app.schemas import User, Collection, CollectionUpdate
-from app.utils import verify_token_validity
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate, page_items
+from app.routers.links import BATCH_MAX_LINKS
+from app.schemas import (Collection, CollectionLinksBatch, CollectionLinksBatchResult, CollectionPage,
+                         CollectionSummary, CollectionUpdate, Link, LinkPreview)
+from app.utils import hash_url
 
 routerCollections = APIRouter(
     prefix="/collections",
     tags=["Collections"],
 )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
-@routerCollections.get("/get_collections", response_model=list[Collection])
-def get_links(user: User = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+DEFAULT_LINK_PREVIEW = 3
+MAX_LINK_PREVIEW = 20
+
+EXPORT_COLLECTION_FIELDS = ("id", "name", "description", "created_at", "updated_at")
+EXPORT_LINK_FIELDS = ("id", "title", "url", "description", "image", "type", "status", "created_at", "updated_at")
+
+async def _with_links(db: AsyncSession, collection_id: int) -> Collections:
+    """
+    Загружает коллекцию вместе со ссылками (по умолчанию связь links не загружается).
+    """
+    return (await db.execute(
+        select(Collections)
+        .where(Collections.id == collection_id)
+        .options(selectinload(Collections.links))
+        .execution_options(populate_existing=True)
+    )).scalar_one()
+
+
+async def _link_summaries(db: AsyncSession, collection_ids: list[int], preview: int) -> dict[int, tuple[int, list]]:
+    """
+    Одним запросом считает количество ссылок в каждой коллекции
+    и выбирает preview самых новых ссылок.
+    Возвращает {collection_id: (link_count, [последние ссылки])}.
+    """
+    collection_id = t_collection_links.c.collection_id
+    ranked = (
+        select(
+            collection_id,
+            Links.id,
+            Links.title,
+            Links.url,
+            Links.image,
+            Links.type,
+            func.count().over(partition_by=collection_id).label("link_count"),
+            func.row_number().over(
+                partition_by=collection_id,
+                order_by=(Links.created_at.desc(), Links.id.desc())
+            ).label("position"),
+        )
+        .join(Links, Links.id == t_collection_links.c.link_id)
+        .where(collection_id.in_(collection_ids))
+        .subquery()
+    )
+    rows = (await db.execute(
+        select(ranked)
+        .where(ranked.c.position <= max(preview, 1))
+        .order_by(ranked.c.collection_id, ranked.c.position)
+    )).all()
+
+    summaries = {}
+    for row in rows:
+        link_count, recent_links = summaries.setdefault(row.collection_id, (row.link_count, []))
+        if row.position <= preview:
+            recent_links.append(LinkPreview.model_validate(row))
+    return summaries
+
+
+def _batch_link_ids(user_id: int, links_data: CollectionLinksBatch):
+    """
+    Подзапрос id ссылок пользователя по списку URL и id. Списки передаются в БД
+    двумя параметрами-массивами (= ANY), а не отдельным параметром на каждое значение.
+    Чужие и несуществующие ссылки просто не попадают в результат.
+    """
+    url_hashes = list({hash_url(url) for url in links_data.urls})
+    link_ids = list(set(links_data.link_ids))
+    requested = len(url_hashes) + len(link_ids)
+    if not requested:
+        raise HTTPException(status_code=400, detail="Не переданы ссылки")
+    if requested > BATCH_MAX_LINKS:
+        raise HTTPException(status_code=400, detail=f"Можно передать не более {BATCH_MAX_LINKS} ссылок")
+    stmt = (
+        select(Links.id)
+        .where(Links.user_id == user_id)
+        .where(or_(
+            Links.url_hash == any_(bindparam("url_hashes", url_hashes, type_=ARRAY(LargeBinary))),
+            Links.id == any_(bindparam("link_ids", link_ids, type_=ARRAY(Integer))),
+        ))
+    )
+    return stmt, requested
+
+
+async def _touch_collection(db: AsyncSession, user_id: int, name: Optional[str]) -> int:
+    """
+    Обновляет updated_at коллекции пользователя и возвращает её id: поиск и отметка
+    об изменении (для ETag в get_collections) одним запросом.
+    """
+    collection_id = (await db.execute(
+        update(Collections)
+        .where(Collections.user_id == user_id)
+        .where(Collections.name == name)
+        .values(updated_at=datetime.utcnow())
+        .returning(Collections.id)
+    )).scalar_one_or_none()
+    if collection_id is None:
+        raise HTTPException(status_code=400, detail="Коллекция не существует")
+    return collection_id
+
+
+async def _collections_version(db: AsyncSession, user_id: int) -> tuple:
+    """
+    Количество и max(updated_at) коллекций и ссылок пользователя, одним запросом без загрузки строк.
+    Ссылки учитываются, потому что в ответ входят их количество и превью.
+    Изменение состава коллекции обновляет её updated_at.
     """
-    Получить список всех коллекций пользователя
+    collections = select(Collections).where(Collections.user_id == user_id)
+    links = select(Links).where(Links.user_id == user_id)
+    return tuple((await db.execute(select(
+        collections.with_only_columns(func.count()).scalar_subquery(),
+        collections.with_only_columns(func.max(Collections.updated_at)).scalar_subquery(),
+        links.with_only_columns(func.count()).scalar_subquery(),
+        links.with_only_columns(func.max(Links.updated_at)).scalar_subquery(),
+    ))).one())
+
+
+@routerCollections.get("/get_collections", response_model=CollectionPage)
+async def get_links(request: Request,
+                    response: Response,
+                    user_id: int = Depends(get_current_user_id),
+                    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+                    cursor: Optional[str] = None,
+                    preview: int = Query(DEFAULT_LINK_PREVIEW, ge=0, le=MAX_LINK_PREVIEW),
+                    include: Optional[str] = None,
+                    db: AsyncSession = Depends(get_db)):
+    """
+    Получить список коллекций пользователя, от новых к старым.
+    Для каждой коллекции возвращается количество ссылок и несколько последних ссылок.
+    Ответ содержит ETag; если коллекции и ссылки не менялись, запрос с If-None-Match получит 304.
+
+    - **limit**: Количество коллекций на странице
+    - **cursor**: Значение next_cursor из предыдущего ответа
+    - **preview**: Сколько последних ссылок показать для каждой коллекции
+    - **include**: links — вернуть все ссылки коллекций
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        result = db.execute(select(Collections).where(Collections.user_id == user.id)).scalars().all()
-        if not result:
+        if include not in (None, "links"):
+            raise HTTPException(status_code=400, detail="Допустимое значение include: links")
+
+        etag = make_etag(user_id, *await _collections_version(db, user_id), limit, cursor, preview, include)
+        if etag_matches(request, etag):
+            return not_modified(etag)
+
+        stmt = paginate(select(Collections).where(Collections.user_id == user_id), Collections, cursor, limit)
+        if include == "links":
+            stmt = stmt.options(selectinload(Collections.links))
+        collections, next_cursor = page_items((await db.execute(stmt)).scalars().all(), limit)
+        if not collections and not cursor:
             raise HTTPException(status_code=402, detail="У пользователя нет коллекций")
-        return result
+
+        summaries = await _link_summaries(db, [collection.id for collection in collections], preview)
+        items = []
+        for collection in collections:
+            link_count, recent_links = summaries.get(collection.id, (0, []))
+            items.append(CollectionSummary(
+                id=collection.id,
+                user_id=collection.user_id,
+                name=collection.name,
+                description=collection.description,
+                created_at=collection.created_at,
+                updated_at=collection.updated_at,
+                link_count=link_count,
+                recent_links=recent_links,
+                links=[Link.model_validate(link) for link in collection.links] if include == "links" else None,
+            ))
+        response.headers["ETag"] = etag
+        return {"items": items, "next_cursor": next_cursor}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
+
+def export_query(user_id: int):
+    return (
+        select(*(getattr(Collections, field) for field in EXPORT_COLLECTION_FIELDS),
+               *(getattr(Links, field) for field in EXPORT_LINK_FIELDS))
+        .select_from(Collections)
+        .outerjoin(t_collection_links, t_collection_links.c.collection_id == Collections.id)
+        .outerjoin(Links, Links.id == t_collection_links.c.link_id)
+        .where(Collections.user_id == user_id)
+        .order_by(Collections.created_at.desc(), Collections.id.desc(), Links.created_at.desc(), Links.id.desc())
+    )
+
+@routerCollections.get("/export")
+async def export_collections(user_id: int = Depends(get_current_user_id),
+                             format: Optional[str] = "ndjson"):
+    """
+    Выгрузить все коллекции пользователя со ссылками, от новых к старым.
+    Ответ передаётся потоком, память сервера не зависит от количества коллекций и ссылок.
+
+    - **format**: ndjson (коллекция со списком links в строке) или csv (строка на каждую ссылку коллекции)
+    """
+    return export_response(
+        export_query(user_id),
+        EXPORT_COLLECTION_FIELDS + EXPORT_LINK_FIELDS,
+        check_format(format),
+        "collections",
+        grouped=(len(EXPORT_COLLECTION_FIELDS), "links"),
+        csv_header=tuple(f"collection_{field}" for field in EXPORT_COLLECTION_FIELDS)
+                   + tuple(f"link_{field}" for field in EXPORT_LINK_FIELDS),
+    )
 
 @routerCollections.get("/get_collection", response_model=Collection)
-def get_links(user: User = Depends(get_current_user),
-              token: str = Depends(oauth2_scheme),
-              name: Optional[str] = None):
+async def get_links(user_id: int = Depends(get_current_user_id),
+                    name: Optional[str] = None,
+                    db: AsyncSession = Depends(get_db)):
     """
     Получить коллекцию по названию
 
     - **name**: Название коллекции
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        collection = db.execute(
+        collection = (await db.execute(
             select(Collections)
-            .where(Collections.user_id == user.id)
+            .where(Collections.user_id == user_id)
             .where(Collections.name == name)
-        ).scalar_one_or_none()
+            .options(selectinload(Collections.links))
+        )).scalar_one_or_none()
         if not collection:
             raise HTTPException(status_code=400, detail="Коллекция не существует")
         return collection
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @routerCollections.delete("/delete_collection", response_model=Collection)
-def delete_collection(user: User = Depends(get_current_user),
-                      token: str = Depends(oauth2_scheme),
-                      name: Optional[str] = None):
+async def delete_collection(user_id: int = Depends(get_current_user_id),
+                            name: Optional[str] = None,
+                            db: AsyncSession = Depends(get_db)):
     """
     Удалить коллекцию по названию
 
     - **name**: Название коллекции
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Collections).where(Collections.name == name).where(Collections.user_id == user.id)
-        result = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Collections).where(Collections.name == name).where(Collections.user_id == user_id)
+        result = (await db.execute(stmt)).scalar_one_or_none()
 
         if not result:
             raise HTTPException(status_code=400, detail="Коллекция не существует")
 
-        stmt = delete(Collections).where(Collections.name == name).where(Collections.user_id == user.id)
-        result = db.execute(stmt)
-        db.commit()
+        stmt = delete(Collections).where(Collections.name == name).where(Collections.user_id == user_id)
+        result = await db.execute(stmt)
+        await db.commit()
         return {"msg": "Коллекция удалена", "Collections deleted": result.rowcount}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @routerCollections.post("/create_collection", response_model=Collection)
-def create_collection(user: User = Depends(get_current_user),
-                      token: str = Depends(oauth2_scheme),
-                      name: Optional[str] = None,
-                      description: Optional[str] = None):
+async def create_collection(user_id: int = Depends(get_current_user_id),
+                            name: Optional[str] = None,
+                            description: Optional[str] = None,
+                            db: AsyncSession = Depends(get_db)):
     """
     Создать новую коллекцию
 
     - **name**: Название коллекции
     - **description**: Описание коллекции
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Collections).where(Collections.name == name)
-        collection = db.execute(stmt)
+        stmt = select(Collections).where(Collections.user_id == user_id).where(Collections.name == name)
+        collection = await db.execute(stmt)
         if collection.scalar_one_or_none():
             raise HTTPException(status_code=400, detail="Коллекция с таким названием уже существует")
 
         new_collection = Collections(
             name=name,
-            user_id=user.id,
+            user_id=user_id,
             description=description,
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
         db.add(new_collection)
-        db.commit()
-        db.refresh(new_collection)
-        return new_collection
+        await db.flush()
+        collection_id = new_collection.id
+        await db.commit()
+        return await _with_links(db, collection_id)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @routerCollections.post("/update_collection", response_model=Collection)
-def update_collection(update_data: CollectionUpdate,
-                      user: User = Depends(get_current_user),
-                      token: str = Depends(oauth2_scheme),
-                      name: Optional[str] = None):
+async def update_collection(update_data: CollectionUpdate,
+                            user_id: int = Depends(get_current_user_id),
+                            name: Optional[str] = None,
+                            db: AsyncSession = Depends(get_db)):
     """
     Обновить данные коллекции
 
     - **name**: Название коллекции
     - **update_data**: Поля для обновления
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Collections).where(Collections.name == name).where(Collections.user_id == user.id)
-        collection = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Collections).where(Collections.name == name).where(Collections.user_id == user_id)
+        collection = (await db.execute(stmt)).scalar_one_or_none()
         if not collection:
             raise HTTPException(status_code=400, detail="Коллекция не существует")
 
@@ -152,44 +327,41 @@ def update_collection(update_data: CollectionUpdate,
             setattr(collection, field, value)
 
         collection.updated_at = datetime.utcnow()
-        db.merge(collection)
-        db.commit()
-        db.refresh(collection)
-        return collection
+        collection_id = collection.id
+        await db.commit()
+        return await _with_links(db, collection_id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @routerCollections.post("/add_link", response_model=Collection)
-def add_link(user: User = Depends(get_current_user),
-             token: str = Depends(oauth2_scheme),
-             url: Optional[str] = None,
-             name: Optional[str] = None):
+async def add_link(user_id: int = Depends(get_current_user_id),
+                   url: Optional[str] = None,
+                   name: Optional[str] = None,
+                   db: AsyncSession = Depends(get_db)):
     """
     Добавить ссылку в коллекцию
 
     - **url**: URL ссылки
     - **name**: Название коллекции
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Links).where(Links.url == url).where(Links.user_id == user.id)
-        link = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Links).where(Links.url_hash == hash_url(url)).where(Links.user_id == user_id)
+        link = (await db.execute(stmt)).scalar_one_or_none()
         if not link:
             raise HTTPException(status_code=400, detail="Ссылка не найдена в вашей базе данных")
 
-        collection = db.execute(select(Collections).where(Collections.name == name)).scalar_one_or_none()
+        collection = (await db.execute(
+            select(Collections).where(Collections.user_id == user_id).where(Collections.name == name)
+        )).scalar_one_or_none()
         if not collection:
             raise HTTPException(status_code=400, detail="Коллекция не существует")
 
-        existing_link = db.execute(
+        existing_link = (await db.execute(
             select(t_collection_links)
             .where(t_collection_links.c.collection_id == collection.id)
             .where(t_collection_links.c.link_id == link.id)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
         if existing_link:
             raise HTTPException(
                 status_code=400,
@@ -199,44 +371,43 @@ def add_link(user: User = Depends(get_current_user),
             collection_id=collection.id,
             link_id=link.id
         )
-        db.execute(stmt)
-        db.commit()
-        db.refresh(collection)
-        return collection
+        collection.updated_at = datetime.utcnow()
+        collection_id = collection.id
+        await db.execute(stmt)
+        await db.commit()
+        return await _with_links(db, collection_id)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 @routerCollections.post("/remove_link", response_model=Collection)
-def delete_link(user: User = Depends(get_current_user),
-                token: str = Depends(oauth2_scheme),
-                url: Optional[str] = None,
-                name: Optional[str] = None):
+async def delete_link(user_id: int = Depends(get_current_user_id),
+                      url: Optional[str] = None,
+                      name: Optional[str] = None,
+                      db: AsyncSession = Depends(get_db)):
     """
     Удалить ссылку из коллекции
 
     - **url**: URL ссылки
     - **name**: Название коллекции
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Links).where(Links.url == url).where(Links.user_id == user.id)
-        link = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Links).where(Links.url_hash == hash_url(url)).where(Links.user_id == user_id)
+        link = (await db.execute(stmt)).scalar_one_or_none()
         if not link:
             raise HTTPException(status_code=400, detail="Ссылка не найдена в вашей базе данных")
 
-        collection = db.execute(select(Collections).where(Collections.name == name)).scalar_one_or_none()
+        collection = (await db.execute(
+            select(Collections).where(Collections.user_id == user_id).where(Collections.name == name)
+        )).scalar_one_or_none()
         if not collection:
             raise HTTPException(status_code=400, detail="Коллекция не существует")
 
-        link_in_collection = db.execute(
+        link_in_collection = (await db.execute(
             select(t_collection_links)
             .where(t_collection_links.c.collection_id == collection.id)
             .where(t_collection_links.c.link_id == link.id)
-        ).scalar_one_or_none()
+        )).scalar_one_or_none()
 
         if not link_in_collection:
             raise HTTPException(
@@ -248,12 +419,64 @@ def delete_link(user: User = Depends(get_current_user),
             (t_collection_links.c.collection_id == collection.id) &
             (t_collection_links.c.link_id == link.id)
         )
-        db.execute(stmt)
-        db.commit()
-        db.refresh(collection)
-        return collection
+        collection.updated_at = datetime.utcnow()
+        collection_id = collection.id
+        await db.execute(stmt)
+        await db.commit()
+        return await _with_links(db, collection_id)
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+@routerCollections.post("/add_links", response_model=CollectionLinksBatchResult)
+async def add_links(links_data: CollectionLinksBatch,
+                    user_id: int = Depends(get_current_user_id),
+                    name: Optional[str] = None,
+                    db: AsyncSession = Depends(get_db)):
+    """
+    Добавить несколько ссылок в коллекцию одним запросом к БД.
+    Ссылки, которых нет в вашей базе данных или которые уже есть в коллекции, пропускаются.
+
+    - **name**: Название коллекции
+    - **links_data**: URL (urls) и/или id (link_ids) ссылок
+    """
+    try:
+        link_ids, requested = _batch_link_ids(user_id, links_data)
+        collection_id = await _touch_collection(db, user_id, name)
+        link_ids = link_ids.add_columns(bindparam("collection_id", collection_id, type_=Integer))
+        result = await db.execute(
+            pg_insert(t_collection_links)
+            .from_select(["link_id", "collection_id"], link_ids)
+            .on_conflict_do_nothing()
+        )
+        await db.commit()
+        return {"requested": requested, "changed": result.rowcount}
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail=str(e))
+
+@routerCollections.post("/remove_links", response_model=CollectionLinksBatchResult)
+async def remove_links(links_data: CollectionLinksBatch,
+                       user_id: int = Depends(get_current_user_id),
+                       name: Optional[str] = None,
+                       db: AsyncSession = Depends(get_db)):
+    """
+    Удалить несколько ссылок из коллекции одним запросом к БД.
+    Ссылки, которых нет в коллекции, пропускаются.
+
+    - **name**: Название коллекции
+    - **links_data**: URL (urls) и/или id (link_ids) ссылок
+    """
+    try:
+        link_ids, requested = _batch_link_ids(user_id, links_data)
+        collection_id = await _touch_collection(db, user_id, name)
+        result = await db.execute(
+            delete(t_collection_links)
+            .where(t_collection_links.c.collection_id == collection_id)
+            .where(t_collection_links.c.link_id == any_(link_ids.scalar_subquery()))
+        )
+        await db.commit()
+        return {"requested": requested, "changed": result.rowcount}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
@@ -1,49 +1,117 @@
+import asyncio
 import datetime
+import os
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Query, HTTPException
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy import select, delete
+import orjson
+from fastapi import APIRouter, Depends, Query, HTTPException, Request, Response
+from sqlalchemy import select, delete, func, cast, text, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user_id
 from app.database import get_db
-from app.models import Links
-from app.schemas import User, Link, LinkCreate, LinkUpdate
-from app.utils import verify_token_validity, get_metadata_from_link
+from app.models import Links, LINKS_SEARCH_CONFIG
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, paginate, page_items, encode_rank_cursor, decode_rank_cursor
+from app.schemas import Link, LinkCreate, LinkUpdate, LinkPage, LinksBatchCreate, LinkBatchResult
+from app.enrichment import enqueue_link
+from app.etag import etag_matches, make_etag, not_modified
+from app.export import check_format, export_response
+from app.utils import canonicalize_url, get_metadata_from_link, hash_url
 
 routerLinks = APIRouter(
     prefix="/links",
     tags=["Links"],
 )
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
+# asyncpg передаёт в одном запросе не больше 32767 параметров, а многострочный INSERT в _insert_links
+# занимает по параметру на каждую колонку строки: поля LinkCreate, url_hash, user_id, created_at, updated_at
+ASYNCPG_MAX_PARAMS = 32767
+LINK_INSERT_PARAMS = len(LinkCreate.model_fields) + 4
+BATCH_MAX_LINKS = min(int(os.getenv("BATCH_MAX_LINKS", 1000)), ASYNCPG_MAX_PARAMS // LINK_INSERT_PARAMS)
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", 16))
+# Режим по умолчанию для /links/create_link: загружать метаданные в фоне
+LINK_ENRICH_BACKGROUND = os.getenv("LINK_ENRICH_BACKGROUND", "false").lower() in ("1", "true", "yes")
 
-@routerLinks.get("/get_links", response_model=list[Link])
-def get_links(user: User = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+# Поля схемы Link в порядке вывода и соответствующие им колонки
+LINK_FIELDS = tuple(Link.model_fields)
+LINK_COLUMNS = tuple(getattr(Links, field) for field in LINK_FIELDS)
+
+
+def render_link_page(rows, next_cursor: Optional[str]) -> bytes:
     """
-    Получить все ссылки текущего пользователя.
+    JSON страницы ссылок напрямую из строк Core запроса по LINK_COLUMNS, без ORM объектов
+    и pydantic. Результат совпадает с сериализацией LinkPage (tests/test_link_serialization.py).
+    """
+    return orjson.dumps({
+        "items": [dict(zip(LINK_FIELDS, row)) for row in rows],
+        "next_cursor": next_cursor,
+    })
+
+
+@routerLinks.get("/get_links", response_model=LinkPage)
+async def get_links(
+        request: Request,
+        user_id: int = Depends(get_current_user_id),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
+):
     """
-    db = next(get_db())
-    verify_token_validity(token)
-    result = db.execute(select(Links).where(Links.user_id == user.id))
-    return result.scalars().all()
+    Получить ссылки текущего пользователя, от новых к старым.
+    Ответ содержит ETag; если ссылки не менялись, запрос с If-None-Match получит 304.
+
+    - **limit**: Количество ссылок на странице.
+    - **cursor**: Значение next_cursor из предыдущего ответа.
+    """
+    # Любое изменение ссылок меняет их количество или max(updated_at)
+    link_count, last_update = (await db.execute(
+        select(func.count(), func.max(Links.updated_at)).where(Links.user_id == user_id)
+    )).one()
+    etag = make_etag(user_id, link_count, last_update, limit, cursor)
+    if etag_matches(request, etag):
+        return not_modified(etag)
+
+    stmt = paginate(select(*LINK_COLUMNS).where(Links.user_id == user_id), Links, cursor, limit)
+    rows, next_cursor = page_items((await db.execute(stmt)).all(), limit)
+    return Response(render_link_page(rows, next_cursor), media_type="application/json", headers={"ETag": etag})
+
+
+def export_query(user_id: int):
+    return (
+        select(*LINK_COLUMNS)
+        .where(Links.user_id == user_id)
+        .order_by(Links.created_at.desc(), Links.id.desc())
+    )
+
+
+@routerLinks.get("/export")
+async def export_links(
+        user_id: int = Depends(get_current_user_id),
+        format: Optional[str] = "ndjson",
+):
+    """
+    Выгрузить все ссылки текущего пользователя, от новых к старым.
+    Ответ передаётся потоком, память сервера не зависит от количества ссылок.
+
+    - **format**: ndjson (по объекту Link в строке) или csv.
+    """
+    return export_response(export_query(user_id), LINK_FIELDS, check_format(format), "links")
 
 
 @routerLinks.get("/get_link", response_model=Link)
-def get_link(
-        user: User = Depends(get_current_user),
-        token: str = Depends(oauth2_scheme),
-        url: Optional[str] = Query(...)
+async def get_link(
+        user_id: int = Depends(get_current_user_id),
+        url: Optional[str] = Query(...),
+        db: AsyncSession = Depends(get_db),
 ):
     """
     Получить ссылку по её URL.
 
     - **url**: Ссылка, которую нужно получить.
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        result = db.execute(select(Links).where(Links.user_id == user.id).where(Links.url == url)).scalar_one_or_none()
+        result = (await db.execute(select(Links).where(Links.user_id == user_id).where(Links.url_hash == hash_url(url)))).scalar_one_or_none()
         if not result:
             raise HTTPException(status_code=400, detail="Ссылка не существует")
         return result
@@ -51,80 +119,233 @@ def get_link(
         raise HTTPException(status_code=400, detail=str(e))
 
 
-@routerLinks.post("/create_link", response_model=Link)
-def add_url(
-        user: User = Depends(get_current_user),
-        token: str = Depends(oauth2_scheme),
-        url: Optional[str] = None,
+# Поиск идёт подготовленным запросом, и после пяти выполнений PostgreSQL может перейти на общий
+# план без учёта user_id и частоты слов: он читает GIN индекс по всей таблице вместо ссылок
+# пользователя (benchmarks/search.py). SET LOCAL действует до конца транзакции
+SEARCH_CUSTOM_PLAN = text("SET LOCAL plan_cache_mode = force_custom_plan")
+
+
+def search_query(user_id: int, q: str, limit: int, cursor: Optional[str] = None):
+    # limit + 1 строка: по лишней строке видно, есть ли следующая страница
+    query = func.websearch_to_tsquery(cast(LINKS_SEARCH_CONFIG, REGCONFIG), q)
+    rank = func.ts_rank_cd(Links.search_vector, query)
+    stmt = (
+        select(Links, rank.label("rank"))
+        .where(Links.user_id == user_id)
+        .where(Links.search_vector.op("@@")(query))
+    )
+    if cursor:
+        stmt = stmt.where(tuple_(rank, Links.id) < tuple_(*decode_rank_cursor(cursor)))
+    return stmt.order_by(rank.desc(), Links.id.desc()).limit(limit + 1)
+
+
+@routerLinks.get("/search", response_model=LinkPage)
+async def search_links(
+        user_id: int = Depends(get_current_user_id),
+        q: str = Query(..., min_length=1),
+        limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
 ):
     """
-    Создать новую ссылку по URL.
+    Полнотекстовый поиск по заголовкам и описаниям ссылок текущего пользователя.
+    Результаты отсортированы по релевантности (совпадения в заголовке важнее).
 
-    - **url**: Ссылка, которую нужно сохранить.
+    - **q**: Поисковый запрос, поддерживаются "фразы", OR и -исключения.
+    - **limit**: Количество ссылок на странице.
+    - **cursor**: Значение next_cursor из предыдущего ответа.
     """
-    db = next(get_db())
-    verify_token_validity(token)
-    try:
-        stmt = select(Links).where(Links.url == url)
-        link = db.execute(stmt)
-        if link.scalar_one_or_none():
-            raise HTTPException(status_code=400, detail="Ссылка уже существует")
+    await db.execute(SEARCH_CUSTOM_PLAN)
+    rows = (await db.execute(search_query(user_id, q, limit, cursor))).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_rank_cursor(rows[-1].rank, rows[-1].Links.id)
+    return {"items": [row.Links for row in rows], "next_cursor": next_cursor}
 
-        metadata = get_metadata_from_link(url)
-        link_data = LinkCreate(**metadata)
 
-        user_id = user.id
+async def _link_exists(db: AsyncSession, user_id: int, url: Optional[str]) -> bool:
+    stmt = select(Links.id).where(Links.user_id == user_id).where(Links.url_hash == hash_url(url))
+    return (await db.execute(stmt)).first() is not None
+
 
+async def _save_link(db: AsyncSession, link_data: LinkCreate, user_id: int, status: str = "ready") -> Links:
+    try:
         new_link = Links(
             title=link_data.title,
             url=link_data.url,
+            url_hash=hash_url(link_data.url),
             description=link_data.description,
             image=link_data.image,
             type=link_data.type,
             user_id=user_id,
+            status=status,
             created_at=datetime.datetime.utcnow(),
             updated_at=datetime.datetime.utcnow()
         )
 
         db.add(new_link)
-        db.commit()
-        db.refresh(new_link)
+        await db.commit()
+        await db.refresh(new_link)
 
         return new_link
+    except Exception:
+        await db.rollback()
+        raise
+
+
+@routerLinks.post("/create_link", response_model=Link)
+async def add_url(
+        user_id: int = Depends(get_current_user_id),
+        url: Optional[str] = None,
+        background: bool = LINK_ENRICH_BACKGROUND,
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Создать новую ссылку по URL.
+
+    - **url**: Ссылка, которую нужно сохранить.
+    - **background**: Сохранить ссылку сразу (статус pending), а метаданные загрузить в фоне.
+    """
+    url = canonicalize_url(url)
+    try:
+        if await _link_exists(db, user_id, url):
+            raise HTTPException(status_code=400, detail="Ссылка уже существует")
+
+        if background:
+            if not url:
+                raise HTTPException(status_code=400, detail="Invalid URL.")
+            link_data = LinkCreate(title=url, url=url, type=DEFAULT_LINK_TYPE)
+            new_link = await _save_link(db, link_data, user_id, status="pending")
+            enqueue_link(new_link.id, new_link.url, new_link.updated_at)
+            return new_link
+
+        # Завершаем транзакцию, чтобы не держать соединение с БД, пока загружается страница
+        await db.commit()
+        metadata = await get_metadata_from_link(url)
+        link_data = LinkCreate(**metadata)
+
+        return await _save_link(db, link_data, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def _insert_links(db: AsyncSession, rows: list[dict]) -> list[Links]:
+    """
+    Вставляет ссылки одним многострочным INSERT ... ON CONFLICT DO NOTHING RETURNING.
+    Возвращает только реально созданные строки.
+    """
+    if not rows:
+        return []
+    try:
+        stmt = (
+            pg_insert(Links)
+            .values(rows)
+            .on_conflict_do_nothing(index_elements=[Links.user_id, Links.url_hash])
+            .returning(Links)
+        )
+        created = (await db.execute(stmt)).scalars().all()
+        await db.commit()
+        return created
+    except Exception:
+        await db.rollback()
+        raise
+
+
+@routerLinks.post("/create_links", response_model=list[LinkBatchResult])
+async def add_urls(
+        links_data: LinksBatchCreate,
+        user_id: int = Depends(get_current_user_id),
+        db: AsyncSession = Depends(get_db),
+):
+    """
+    Создать несколько ссылок за один запрос.
+
+    Метаданные страниц загружаются параллельно (не более BATCH_FETCH_CONCURRENCY одновременно),
+    все ссылки вставляются одним запросом. Для каждого URL возвращается свой результат.
+
+    - **urls**: Список ссылок, которые нужно сохранить.
+    """
+    requested = list(dict.fromkeys(links_data.urls))
+    if len(requested) > BATCH_MAX_LINKS:
+        raise HTTPException(status_code=400, detail=f"Можно передать не более {BATCH_MAX_LINKS} ссылок")
+
+    canonical = {url: canonicalize_url(url) for url in requested}
+    urls = list(dict.fromkeys(canonical.values()))
+
+    hashes = {url: hash_url(url) for url in urls}
+    # Сравниваем по url_hash, как и ON CONFLICT (user_id, url_hash): сохранённая строка
+    # может быть записана в другом написании того же URL
+    stmt = (
+        select(Links.url_hash)
+        .where(Links.user_id == user_id)
+        .where(Links.url_hash.in_(list(hashes.values())))
+    )
+    existing_hashes = set((await db.execute(stmt)).scalars().all())
+    existing = {url for url in urls if hashes[url] in existing_hashes}
+    # Не держим соединение с БД, пока загружаются страницы
+    await db.commit()
+    semaphore = asyncio.Semaphore(BATCH_FETCH_CONCURRENCY)
+
+    async def fetch_one(url: str):
+        async with semaphore:
+            try:
+                return url, LinkCreate(**await get_metadata_from_link(url)), None
+            except HTTPException as e:
+                return url, None, str(e.detail)
+            except Exception as e:
+                return url, None, str(e)
+
+    fetched = await asyncio.gather(*[fetch_one(url) for url in urls if url not in existing])
+
+    now = datetime.datetime.utcnow()
+    rows = [
+        dict(link_data.model_dump(), url_hash=hash_url(link_data.url), user_id=user_id, created_at=now, updated_at=now)
+        for _, link_data, error in fetched if error is None
+    ]
+    try:
+        created = {bytes(link.url_hash): link for link in await _insert_links(db, rows)}
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
 
+    results = {url: LinkBatchResult(url=url, status="exists", detail="Ссылка уже существует") for url in existing}
+    for url, _, error in fetched:
+        if error is not None:
+            results[url] = LinkBatchResult(url=url, status="error", detail=error)
+        elif hashes[url] in created:
+            results[url] = LinkBatchResult(url=url, status="created", link=Link.model_validate(created[hashes[url]]))
+        else:
+            # Ссылку успели добавить параллельно, пока загружались метаданные
+            results[url] = LinkBatchResult(url=url, status="exists", detail="Ссылка уже существует")
+    # Результат возвращается для каждого переданного URL, даже если несколько из них совпали после канонизации
+    return [results[canonical[url]].model_copy(update={"url": url}) for url in requested]
+
 
 @routerLinks.delete("/delete_link")
-def delete_link(
-        user: User = Depends(get_current_user),
-        token: str = Depends(oauth2_scheme),
+async def delete_link(
+        user_id: int = Depends(get_current_user_id),
         url: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
 ):
     """
     Удалить ссылку по URL.
 
     - **url**: Ссылка, которую нужно удалить.
     """
-    db = next(get_db())
-    verify_token_validity(token)
     try:
-        stmt = select(Links).where(Links.url == url).where(Links.user_id == user.id)
-        result = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Links).where(Links.url_hash == hash_url(url)).where(Links.user_id == user_id)
+        result = (await db.execute(stmt)).scalar_one_or_none()
 
         if not result:
             raise HTTPException(status_code=400, detail="Ссылка не найдена")
 
-        stmt = delete(Links).where(Links.url == url).where(Links.user_id == user.id)
-        result = db.execute(stmt)
-        db.commit()
+        stmt = delete(Links).where(Links.url_hash == hash_url(url)).where(Links.user_id == user_id)
+        result = await db.execute(stmt)
+        await db.commit()
         return {"msg": "Ссылка удалена", "Количество удалённых ссылок": result.rowcount}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
 
 
 ALLOWED_LINK_TYPES = ["website", "book", "article", "music", "video"]
@@ -132,23 +353,21 @@ DEFAULT_LINK_TYPE = "website"
 
 
 @routerLinks.post("/update_link", response_model=Link)
-def update_link(
+async def update_link(
         update_data: LinkUpdate,
-        user: User = Depends(get_current_user),
-        token: str = Depends(oauth2_scheme),
+        user_id: int = Depends(get_current_user_id),
         url: Optional[str] = None,
+        db: AsyncSession = Depends(get_db),
 ):
     """
     Обновить ссылку по URL.
 
     - **url**: Ссылка, которую нужно обновить.
     """
-    db = next(get_db())
-    verify_token_validity(token)
 
     try:
-        stmt = select(Links).where(Links.url == url).where(Links.user_id == user.id)
-        link = db.execute(stmt).scalar_one_or_none()
+        stmt = select(Links).where(Links.url_hash == hash_url(url)).where(Links.user_id == user_id)
+        link = (await db.execute(stmt)).scalar_one_or_none()
 
         if not link:
             raise HTTPException(status_code=400, detail="Ссылка не найдена")
@@ -159,15 +378,14 @@ def update_link(
 
         for field, value in update_dict.items():
             setattr(link, field, value)
+        # Правка пользователя важнее метаданных, которые ещё загружаются в фоне
+        if link.status == "pending":
+            link.status = "ready"
 
         link.updated_at = datetime.datetime.utcnow()
-        db.merge(link)
-        db.commit()
-        db.refresh(link)
+        await db.commit()
         return link
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail=str(e))
-    finally:
-        db.close()
@@ -0,0 +1,50 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.database import get_pool_stats
+from app.email_outbox import get_outbox_stats
+from app.enrichment import get_enrichment_stats
+from app.hashing import get_hashing_stats
+from app.metadata_cache import metadata_cache
+from app.metrics import gauges, render
+from app.routers.auth import user_cache
+from app.send_email import get_smtp_stats
+
+routerMetrics = APIRouter(tags=["Metrics"])
+
+
+def _stats_gauges(prefix: str, stats: dict, help: str) -> list[str]:
+    """Каждое числовое поле статистики модуля выдаётся отдельной метрикой prefix_поле."""
+    lines = []
+    for key, value in stats.items():
+        if isinstance(value, (int, float)):
+            lines.extend(gauges(f"{prefix}_{key}", f"{help}: {key}", {"": value}))
+    return lines
+
+
+def _smtp_gauges() -> list[str]:
+    by_key = {}
+    for username, stats in get_smtp_stats().items():
+        for key, value in stats.items():
+            by_key.setdefault(key, {})[username] = value
+    lines = []
+    for key, values in by_key.items():
+        lines.extend(gauges(f"smtp_pool_{key}", f"Пул SMTP соединений: {key}", values, label="pool"))
+    return lines
+
+
+@routerMetrics.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics():
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    extra = [
+        *_stats_gauges("db_pool", get_pool_stats(), "Пул соединений с БД"),
+        *_stats_gauges("hashing", get_hashing_stats(), "Пул процессов bcrypt"),
+        *_stats_gauges("enrichment", get_enrichment_stats(), "Фоновая загрузка метаданных"),
+        *_stats_gauges("metadata_cache", metadata_cache.stats(), "Кэш метаданных страниц"),
+        *_stats_gauges("user_cache", user_cache.stats(), "Кэш авторизованных пользователей"),
+        *_stats_gauges("email_outbox", get_outbox_stats(), "Очередь писем"),
+        *_smtp_gauges(),
+    ]
+    return PlainTextResponse(render(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
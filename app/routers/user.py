@@ -4,94 +4,90 @@ import secrets
 from typing import Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query
-from fastapi.security import OAuth2PasswordBearer
 from pydantic import BaseModel
 from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.routers.auth import get_current_user
+from app.routers.auth import get_current_user_id, user_cache
 from app.database import get_db
 from app.models import Users, PasswordResetToken
-from app.send_email import send_password_reset_email
-from app.utils import hash_password, verify_password, verify_token_validity
+from app.email_outbox import enqueue_email, wake_outbox_worker
+from app.send_email import password_reset_email
+from app.hashing import hash_password_async, verify_password_async
 
 router = APIRouter(
     prefix="/user",
     tags=["User"],
 )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
-
 
 @router.post('/change_password')
-def change_password(
-        current_user: Users = Depends(get_current_user),
-        token: str = Depends(oauth2_scheme),
+async def change_password(
+        user_id: int = Depends(get_current_user_id),
         new_password1: Optional[str] = None,
-        new_password2: Optional[str] = None
+        new_password2: Optional[str] = None,
+        db: AsyncSession = Depends(get_db)
 ):
     """
     Изменение пароля пользователя.
     """
-    db = next(get_db())
-    verify_token_validity(token)
-
     if len(new_password1) < 8:
         raise HTTPException(status_code=400, detail="Пароль должен содержать минимум 8 символов.")
 
     if new_password1 != new_password2:
         raise HTTPException(status_code=400, detail="Новый пароль и подтверждение не совпадают.")
 
-    if verify_password(new_password1, current_user.password_hash):
+    current_user = (await db.execute(select(Users).where(Users.id == user_id))).scalar_one_or_none()
+    if current_user is None:
+        raise HTTPException(status_code=400, detail="Пользователь не найден.")
+
+    if await verify_password_async(new_password1, current_user.password_hash):
         raise HTTPException(status_code=400, detail="Новый пароль не должен совпадать со старым.")
 
-    hashed_new_password = hash_password(new_password1)
+    hashed_new_password = await hash_password_async(new_password1)
     if not hashed_new_password:
         raise HTTPException(status_code=400, detail="Не удалось захешировать новый пароль.")
 
     try:
         current_user.password_hash = hashed_new_password
-        db.merge(current_user)
-        db.commit()
+        await db.commit()
+        user_cache.invalidate(user_id)
         return {"message": "Пароль успешно изменён"}
     except Exception:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=400, detail="Ошибка при обновлении пароля.")
-    finally:
-        db.close()
 
 
 @router.post("/request-password-reset")
-async def request_password_reset(email: str):
+async def request_password_reset(email: str, db: AsyncSession = Depends(get_db)):
     """
     Запрос на сброс пароля по email.
     """
-    db = next(get_db())
-    try:
-        user = db.execute(
-            select(Users).where(Users.email == email)
-        ).scalar_one_or_none()
+    user = (await db.execute(
+        select(Users).where(Users.email == email)
+    )).scalar_one_or_none()
 
-        if not user:
-            return {"message": "Если пользователь с таким email существует, ссылка для сброса отправлена."}
+    if not user:
+        return {"message": "Если пользователь с таким email существует, ссылка для сброса отправлена."}
 
-        token = secrets.token_urlsafe(32)
-        expires_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(minutes=30)
 
-        reset_token = PasswordResetToken(
-            user_id=user.id,
-            token=token,
-            expires_at=expires_at
-        )
+    reset_token = PasswordResetToken(
+        user_id=user.id,
+        token=token,
+        expires_at=expires_at
+    )
 
-        db.add(reset_token)
-        db.commit()
+    reset_link = f"{os.getenv('BASE_URL')}/user/reset-password?token={token}"
 
-        reset_link = f"{os.getenv('BASE_URL')}/user/reset-password?token={token}"
-        send_password_reset_email(email, reset_link)
+    db.add(reset_token)
+    # Письмо попадает в outbox в той же транзакции, что и токен
+    enqueue_email(db, email, *password_reset_email(reset_link))
+    await db.commit()
+    wake_outbox_worker()
 
-        return {"message": "Если пользователь с таким email существует, ссылка для сброса отправлена.", "token": token}
-    finally:
-        db.close()
+    return {"message": "Если пользователь с таким email существует, ссылка для сброса отправлена.", "token": token}
 
 
 class ResetPasswordRequest(BaseModel):
@@ -101,67 +97,60 @@ class ResetPasswordRequest(BaseModel):
 
 
 @router.post("/reset-password")
-async def reset_password(request: ResetPasswordRequest):
+async def reset_password(request: ResetPasswordRequest, db: AsyncSession = Depends(get_db)):
     """
     Сброс пароля по токену.
     """
-    db = next(get_db())
-    try:
-        if request.new_password != request.confirm_password:
-            raise HTTPException(
-                status_code=400,
-                detail="Пароли не совпадают."
-            )
-
-        reset_token = db.execute(
-            select(PasswordResetToken)
-            .where(PasswordResetToken.token == request.token)
-            .where(PasswordResetToken.expires_at > datetime.datetime.utcnow())
-        ).scalar_one_or_none()
-
-        if not reset_token:
-            raise HTTPException(
-                status_code=400,
-                detail="Неверный или просроченный токен."
-            )
-
-        user = db.execute(
-            select(Users).where(Users.id == reset_token.user_id)
-        ).scalar_one_or_none()
-
-        if user:
-            user.password_hash = hash_password(request.new_password)
-            db.delete(reset_token)
-            db.commit()
-            return {"message": "Пароль успешно сброшен."}
+    if request.new_password != request.confirm_password:
+        raise HTTPException(
+            status_code=400,
+            detail="Пароли не совпадают."
+        )
+
+    reset_token = (await db.execute(
+        select(PasswordResetToken)
+        .where(PasswordResetToken.token == request.token)
+        .where(PasswordResetToken.expires_at > datetime.datetime.utcnow())
+    )).scalar_one_or_none()
 
+    if not reset_token:
         raise HTTPException(
             status_code=400,
-            detail="Пользователь не найден."
+            detail="Неверный или просроченный токен."
         )
-    finally:
-        db.close()
+
+    user = (await db.execute(
+        select(Users).where(Users.id == reset_token.user_id)
+    )).scalar_one_or_none()
+
+    if user:
+        user.password_hash = await hash_password_async(request.new_password)
+        await db.delete(reset_token)
+        await db.commit()
+        user_cache.invalidate(user.id)
+        return {"message": "Пароль успешно сброшен."}
+
+    raise HTTPException(
+        status_code=400,
+        detail="Пользователь не найден."
+    )
 
 
 @router.get("/validate-reset-token")
-async def validate_reset_token(token: str):
+async def validate_reset_token(token: str, db: AsyncSession = Depends(get_db)):
     """
     Проверка действительности токена сброса пароля.
     """
-    db = next(get_db())
-    try:
-        reset_token = db.execute(
-            select(PasswordResetToken)
-            .where(PasswordResetToken.token == token)
-            .where(PasswordResetToken.expires_at > datetime.datetime.utcnow())
-        ).scalar_one_or_none()
-
-        if not reset_token:
-            raise HTTPException(
-                status_code=400,
-                detail="Неверный или просроченный токен."
-            )
-
-        return {"valid": True, "user_id": reset_token.user_id}
-    finally:
-        db.close()
+    reset_token = (await db.execute(
+        select(PasswordResetToken)
+        .where(PasswordResetToken.token == token)
+        .where(PasswordResetToken.expires_at > datetime.datetime.utcnow())
+    )).scalar_one_or_none()
+
+    if not reset_token:
+        raise HTTPException(
+            status_code=400,
+            detail="Неверный или просроченный токен."
+        )
+
+    return {"valid": True, "user_id": reset_token.user_id}
@@ -27,6 +27,7 @@ class LinkUpdate(BaseModel):
 class Link(LinkBase):
     id: int
     user_id: int
+    status: Optional[str] = 'ready'  # pending | ready | failed
     created_at: Optional[datetime] = datetime.utcnow()
     updated_at: Optional[datetime] = datetime.utcnow()
 
@@ -34,6 +35,33 @@ class Link(LinkBase):
         from_attributes = True
 
 
+class LinkPreview(BaseModel):
+    id: int
+    title: str
+    url: str
+    image: Optional[str] = None
+    type: Optional[str] = 'website'
+
+    class Config:
+        from_attributes = True
+
+
+class LinkPage(BaseModel):
+    items: List[Link]
+    next_cursor: Optional[str] = None
+
+
+class LinksBatchCreate(BaseModel):
+    urls: List[str]
+
+
+class LinkBatchResult(BaseModel):
+    url: str
+    status: str  # created | exists | error
+    link: Optional[Link] = None
+    detail: Optional[str] = None
+
+
 # === COLLECTIONS ===
 
 class CollectionBase(BaseModel):
@@ -72,6 +100,34 @@ class Collection(CollectionBase):
             return []
         return list(v)
 
+
+class CollectionSummary(CollectionBase):
+    id: int
+    user_id: int
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    link_count: int = 0
+    recent_links: List[LinkPreview] = Field(default_factory=list)
+    links: Optional[List[Link]] = None  # только при include=links
+
+    class Config:
+        from_attributes = True
+
+
+class CollectionPage(BaseModel):
+    items: List[CollectionSummary]
+    next_cursor: Optional[str] = None
+
+
+class CollectionLinksBatch(BaseModel):
+    urls: List[str] = Field(default_factory=list)
+    link_ids: List[int] = Field(default_factory=list)
+
+
+class CollectionLinksBatchResult(BaseModel):
+    requested: int  # сколько разных URL и id передано
+    changed: int  # сколько добавлено или удалено
+
 # === USERS ===
 
 class UserBase(BaseModel):
@@ -106,6 +162,14 @@ class UserUpdate(BaseModel):
     password: Optional[str] = None
 
 
+class UserIdentity(UserBase):
+    """Данные текущего пользователя, которые можно держать в кэше."""
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
 class User(UserBase):
     id: int
     collections: List[Collection] = []
@@ -1,16 +1,186 @@
+import asyncio
+import queue
 import smtplib
+import threading
+import time
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
 from dotenv import load_dotenv
 import os
 
+from app.metrics import SMTP_SEND_LATENCY
+
 load_dotenv(dotenv_path='.env')
 
 mail_from = os.getenv("GMAIL")
 mail_password = os.getenv("GMAILPASSWORD")
 
-def send_email(email_from, email_password, email_to, subject, body, is_html=False):
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 587))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").lower() in ("1", "true", "yes")
+SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", 10))
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 2))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", 100))
+# Соединение, простаивавшее дольше, перед отправкой проверяется командой NOOP
+SMTP_IDLE_CHECK = float(os.getenv("SMTP_IDLE_CHECK", 30))
+
+
+class _Connection:
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class SMTPPool:
+    """
+    Пул авторизованных SMTP соединений.
+    Соединение используется для нескольких писем подряд и пересоздаётся при ошибке
+    или после max_messages отправленных писем.
+    """
+
+    def __init__(self, username, password, host=SMTP_HOST, port=SMTP_PORT, size=SMTP_POOL_SIZE,
+                 max_messages=SMTP_MAX_MESSAGES_PER_CONNECTION):
+        self.username = username
+        self.password = password
+        self.host = host
+        self.port = port
+        self.max_messages = max_messages
+        self._idle: "queue.LifoQueue[_Connection]" = queue.LifoQueue()
+        # Ограничивает общее число соединений, включая занятые
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._stats = {"connects": 0, "reconnects": 0, "sent": 0, "failed": 0}
+
+    def _connect(self) -> _Connection:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if self.password:
+                smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count("connects")
+        return _Connection(smtp)
+
+    def _acquire(self) -> _Connection:
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - conn.last_used < SMTP_IDLE_CHECK:
+                return conn
+            try:
+                if conn.smtp.noop()[0] == 250:
+                    return conn
+            except OSError:
+                pass
+            conn.close()
+
+    def _release(self, conn: _Connection):
+        conn.last_used = time.monotonic()
+        if conn.sent >= self.max_messages:
+            conn.close()
+        else:
+            self._idle.put(conn)
+
+    def _count(self, key: str):
+        with self._lock:
+            self._stats[key] += 1
+
+    def send(self, msg: MIMEMultipart):
+        """
+        Отправляет письмо. При обрыве соединения один раз повторяет отправку через новое соединение.
+        """
+        with self._slots:
+            started = time.perf_counter()
+            try:
+                conn = self._acquire()
+            except Exception:
+                SMTP_SEND_LATENCY.observe(time.perf_counter() - started, "error")
+                raise
+            try:
+                try:
+                    conn.smtp.send_message(msg)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                    raise
+                except OSError:
+                    # Сервер закрыл соединение (SMTPServerDisconnected и сетевые ошибки)
+                    conn.smtp.close()
+                    self._count("reconnects")
+                    conn = self._connect()
+                    conn.smtp.send_message(msg)
+            except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException):
+                # Сервер отклонил письмо, но соединение осталось рабочим
+                self._count("failed")
+                self._release(conn)
+                SMTP_SEND_LATENCY.observe(time.perf_counter() - started, "error")
+                raise
+            except Exception:
+                conn.smtp.close()
+                self._count("failed")
+                SMTP_SEND_LATENCY.observe(time.perf_counter() - started, "error")
+                raise
+            conn.sent += 1
+            self._count("sent")
+            self._release(conn)
+            SMTP_SEND_LATENCY.observe(time.perf_counter() - started, "ok")
+
+    async def send_async(self, msg: MIMEMultipart):
+        await asyncio.to_thread(self.send, msg)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"idle": self._idle.qsize(), **self._stats}
+
+
+_pools: dict[tuple, SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(email_from, email_password) -> SMTPPool:
+    with _pools_lock:
+        pool = _pools.get((email_from, email_password))
+        if pool is None:
+            pool = _pools[(email_from, email_password)] = SMTPPool(email_from, email_password)
+        return pool
+
+
+def close_smtp_pools():
+    """
+    Закрывает все SMTP соединения. Вызывается при остановке приложения.
+    """
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def get_smtp_stats() -> dict:
+    with _pools_lock:
+        pools = list(_pools.values())
+    return {pool.username: pool.stats() for pool in pools}
+
+
+def build_message(email_from, email_to, subject, body, is_html=False) -> MIMEMultipart:
     msg = MIMEMultipart()
     msg['From'] = email_from
     msg['To'] = email_to
@@ -19,21 +189,13 @@ def send_email(email_from, email_password, email_to, subject, body, is_html=Fals
     # Выбор типа содержимого: plain text или HTML
     content_type = 'html' if is_html else 'plain'
     msg.attach(MIMEText(body, content_type))
+    return msg
 
-    try:
-        server = smtplib.SMTP("smtp.gmail.com", 587)
-        server.starttls()
-        server.login(email_from, email_password)
-
-        server.sendmail(email_from, email_to, msg.as_string())
-        server.quit()
-
-        print("Email sent!")
-    except Exception as e:
-        print(e)
 
-
-def send_password_reset_email(email: str, reset_link: str):
+def password_reset_email(reset_link: str) -> tuple[str, str]:
+    """
+    Тема и текст письма со ссылкой для сброса пароля.
+    """
     subject = "Запрос на сброс пароля"
 
     html_body = f"""
@@ -47,12 +209,4 @@ def send_password_reset_email(email: str, reset_link: str):
         </body>
     </html>
     """
-
-    send_email(
-        email_from=os.getenv("GMAIL"),
-        email_password=os.getenv("GMAILPASSWORD"),
-        email_to=email,
-        subject=subject,
-        body=html_body,
-        is_html=True
-    )
+    return subject, html_body
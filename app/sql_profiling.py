@@ -0,0 +1,129 @@
+import contextvars
+import logging
+import os
+import re
+import time
+from collections import Counter
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+
+load_dotenv(dotenv_path='.env')
+
+logger = logging.getLogger(__name__)
+
+SQL_PROFILING = os.getenv("SQL_PROFILING", "false").lower() in ("1", "true", "yes")
+# Предупреждение в лог, если запрос выполнил больше SQL запросов
+SQL_PROFILING_MAX_QUERIES = int(os.getenv("SQL_PROFILING_MAX_QUERIES", 10))
+# ...или один и тот же SQL (с точностью до параметров) повторился столько раз: признак N+1
+SQL_PROFILING_MAX_REPEATS = int(os.getenv("SQL_PROFILING_MAX_REPEATS", 3))
+
+_PARAM = re.compile(r"\$\d+(::\w+(\[\])?)?|%\(\w+\)s|\?")
+_PARAM_LIST = re.compile(r"IN \(\?(\s*,\s*\?)*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """
+    Текст SQL без значений параметров: запросы, отличающиеся только параметрами
+    (и длиной списков IN), получают одинаковую форму.
+    """
+    shape = _PARAM.sub("?", statement)
+    shape = _PARAM_LIST.sub("IN (...)", shape)
+    return _SPACES.sub(" ", shape).strip()
+
+
+class QueryProfile:
+    __slots__ = ("queries", "seconds", "shapes")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def repeated(self) -> list[tuple[str, int]]:
+        return [(shape, count) for shape, count in self.shapes.most_common() if count > 1]
+
+
+_profile: contextvars.ContextVar[Optional[QueryProfile]] = contextvars.ContextVar("sql_profile", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _profile.get() is not None:
+        conn.info.setdefault("sql_profiling_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _profile.get()
+    if profile is None:
+        return
+    started = conn.info["sql_profiling_started"].pop()
+    profile.queries += 1
+    profile.seconds += time.perf_counter() - started
+    profile.shapes[statement_shape(statement)] += 1
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute не вызывается, если запрос завершился ошибкой
+    started = exception_context.connection.info.get("sql_profiling_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def install_sql_profiling(sync_engine):
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+
+class SQLProfilingMiddleware:
+    """
+    Профилирование SQL по HTTP запросам (включается SQL_PROFILING=true).
+    Добавляет к ответу заголовки X-DB-Query-Count, X-DB-Time-Ms и X-DB-Repeated-Statements
+    (сколько разных SQL выполнено больше одного раза) и пишет предупреждение в лог,
+    если превышены SQL_PROFILING_MAX_QUERIES или SQL_PROFILING_MAX_REPEATS.
+    Заголовки отражают запросы, выполненные до начала ответа.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        profile = QueryProfile()
+        token = _profile.set(profile)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                repeated = profile.repeated()
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-query-count", str(profile.queries).encode()))
+                headers.append((b"x-db-time-ms", f"{profile.seconds * 1000:.2f}".encode()))
+                headers.append((b"x-db-repeated-statements", str(len(repeated)).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _profile.reset(token)
+            self._check(scope, profile)
+
+    @staticmethod
+    def _check(scope, profile: QueryProfile):
+        repeated = profile.repeated()
+        too_many = profile.queries > SQL_PROFILING_MAX_QUERIES
+        too_repeated = [(shape, count) for shape, count in repeated if count >= SQL_PROFILING_MAX_REPEATS]
+        if not too_many and not too_repeated:
+            return
+        route = scope.get("route")
+        path = route.path if route is not None else scope["path"]
+        details = "; ".join(f"{count}x {shape[:200]}" for shape, count in (too_repeated or repeated)[:5])
+        logger.warning(
+            "%s %s: %d SQL запросов за %.1f мс. Повторяющиеся запросы: %s",
+            scope["method"], path, profile.queries, profile.seconds * 1000, details or "нет",
+        )
@@ -1,6 +1,10 @@
+import hashlib
 import os
-import httpx
-from bs4 import BeautifulSoup
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+
 import requests
 from fastapi import HTTPException
 from passlib.context import CryptContext
@@ -8,6 +12,11 @@ from typing_extensions import Optional
 
 from dotenv import load_dotenv
 
+from app.head_parser import HeadMetadataParser, parse_head
+from app.http_client import stream
+from app.metrics import METADATA_FETCH_LATENCY
+from app.metadata_cache import metadata_cache
+
 load_dotenv(dotenv_path='.env')
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,10 +27,54 @@ def hash_password(password:Optional[str]) -> Optional[str]:
 def verify_password(plain_password:Optional[str], hashed_password: Optional[str]) -> Optional[bool]:
     return pwd_context.verify(plain_password, hashed_password)
 
-def verify_token_validity(token: str, BASE_URL: str = os.getenv("BASE_URL")):
+# Кэш проверенных токенов: token -> (exp, payload).
+# Записи упорядочены по времени использования (LRU) и удаляются, когда истекает exp.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+# Проверка токена через HTTP-запрос к /me (как раньше) — только если явно включена.
+VERIFY_TOKEN_REMOTE = os.getenv("VERIFY_TOKEN_REMOTE", "false").lower() in ("1", "true", "yes")
+
+_verified_tokens: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+_verified_tokens_lock = threading.Lock()
+
+
+def _get_cached_token(token: str) -> Optional[dict]:
+    now = time.time()
+    with _verified_tokens_lock:
+        entry = _verified_tokens.get(token)
+        if entry is None:
+            return None
+        exp, payload = entry
+        if exp <= now:
+            del _verified_tokens[token]
+            return None
+        _verified_tokens.move_to_end(token)
+        return payload
+
+
+def _cache_token(token: str, payload: dict) -> None:
+    exp = payload.get("exp")
+    if not isinstance(exp, (int, float)):
+        return
+    now = time.time()
+    with _verified_tokens_lock:
+        _verified_tokens[token] = (exp, payload)
+        _verified_tokens.move_to_end(token)
+        # Сначала выбрасываем просроченные записи, затем самые старые по использованию.
+        # Токены добавляются примерно в порядке истечения, поэтому просроченные ищем только в начале
+        if len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            while _verified_tokens and next(iter(_verified_tokens.values()))[0] <= now:
+                _verified_tokens.popitem(last=False)
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+
+
+def verify_token_remote(token: str, BASE_URL: str = os.getenv("BASE_URL")):
+    """
+    Проверка токена запросом к эндпоинту /me другого сервера.
+    """
     me_url = f"{BASE_URL}/me"
     headers = {"Authorization": f"Bearer {token}"}
-    response = requests.get(me_url, headers=headers)
+    response = requests.get(me_url, headers=headers, timeout=5)
 
     if response.status_code == 401:
         raise HTTPException(status_code=401, detail="Токен истек или недействителен.")
@@ -29,9 +82,33 @@ def verify_token_validity(token: str, BASE_URL: str = os.getenv("BASE_URL")):
         raise HTTPException(status_code=response.status_code, detail="Неизвестная ошибка при проверке токена.")
     return response.json()  # Возвращаем информацию о пользователе, если токен валиден
 
+
+def verify_token_validity(token: str, remote: bool = VERIFY_TOKEN_REMOTE):
+    """
+    Проверяет JWT токен локально и возвращает его полезные данные.
+    Успешно проверенные токены кэшируются до истечения их срока действия.
+
+    - **remote**: дополнительно проверить токен через /me (межсерверная проверка).
+    """
+    payload = _get_cached_token(token)
+    if payload is None:
+        from app.routers.auth import decode_access_token
+
+        payload = decode_access_token(token)
+        if not payload or payload.get("sub") is None:
+            raise HTTPException(status_code=401, detail="Токен истек или недействителен.")
+        _cache_token(token, payload)
+
+    if remote:
+        verify_token_remote(token)
+    return payload
+
 # Вместо класса Enum просто определяем список допустимых типов
 ALLOWED_LINK_TYPES = ["website", "book", "article", "music", "video"]
 DEFAULT_LINK_TYPE = "website"
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Сколько байт страницы читать в поисках <head>
+METADATA_MAX_BYTES = int(os.getenv("METADATA_MAX_BYTES", 512 * 1024))
 
 
 def normalize_link_type(og_type: Optional[str]) -> str:
@@ -43,45 +120,90 @@ def normalize_link_type(og_type: Optional[str]) -> str:
     # Проверяем, есть ли такое значение в разрешенных типах
     return type_value if type_value in ALLOWED_LINK_TYPES else DEFAULT_LINK_TYPE
 
-def get_metadata_from_link(url: Optional[str]):
+def canonicalize_url(url: Optional[str]) -> str:
     """
-    Извлекает метаданные страницы (Open Graph или стандартные meta-теги).
-    Возвращает словарь, который можно передать в LinkCreate.
+    Приводит URL к каноническому виду, в котором ссылка хранится и ищется:
+    схема и хост в нижнем регистре, без порта по умолчанию, без фрагмента,
+    без параметров utm_* и без завершающего слеша в пути.
     """
     if not url:
-        raise HTTPException(status_code=400, detail="Invalid URL.")
+        return ""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if ":" in host:
+        # IPv6 адрес: hostname возвращается без квадратных скобок
+        host = f"[{host}]"
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8"
-        }
-        with httpx.Client() as client:  # Changed from AsyncClient to Client since your route isn't async
-            response = client.get(url, headers=headers, follow_redirects=True)
-            response.raise_for_status()
-            html = response.text
-
-        soup = BeautifulSoup(html, "html.parser")
+        port = parts.port
+    except ValueError:
+        # Некорректный порт: такой URL не загрузится, оставляем его как есть
+        return url.strip()
+    if port and DEFAULT_PORTS.get(scheme) != port:
+        host = f"{host}:{port}"
+    if parts.username is not None:
+        userinfo = parts.username if parts.password is None else f"{parts.username}:{parts.password}"
+        host = f"{userinfo}@{host}"
+    path = parts.path or "/"
+    if len(path) > 1:
+        path = path.rstrip("/") or "/"
+    # Остальные параметры сохраняются как есть, без перекодирования
+    query = "&".join(
+        param for param in parts.query.split("&")
+        if param and not param.split("=", 1)[0].lower().startswith("utm_")
+    )
+    return urlunsplit((scheme, host, path, query, ""))
+
+
+def hash_url(url: Optional[str]) -> bytes:
+    """
+    sha256 канонического URL: значение колонки Links.url_hash, по которой ищутся ссылки.
+    """
+    return hashlib.sha256(canonicalize_url(url).encode()).digest()
 
-        og_title = soup.find("meta", attrs={"property": "og:title"})
-        og_description = soup.find("meta", attrs={"property": "og:description"})
-        og_image = soup.find("meta", attrs={"property": "og:image"})
-        og_type = soup.find("meta", attrs={"property": "og:type"})
 
-        meta_title = soup.find("title")
-        meta_description = soup.find("meta", attrs={"name": "description"})  # Fixed property to name
+async def get_metadata_from_link(url: Optional[str]):
+    """
+    Извлекает метаданные страницы (Open Graph или стандартные meta-теги).
+    Возвращает словарь, который можно передать в LinkCreate.
+    Результаты (в том числе ошибки) кэшируются по каноническому URL.
+    """
+    if not url:
+        raise HTTPException(status_code=400, detail="Invalid URL.")
+    metadata = await metadata_cache.get_or_fetch(canonicalize_url(url), lambda: _fetch_metadata(url))
+    metadata["url"] = url
+    return metadata
 
-        link_type = DEFAULT_LINK_TYPE  # Значение по умолчанию
-        if og_type:
-            link_type = normalize_link_type(og_type.get("content"))
 
-        result = {
-            "title": og_title["content"] if og_title else meta_title.text if meta_title else url,
-            "url": url,
-            "description": og_description["content"] if og_description else meta_description["content"] if meta_description else None,
-            "image": og_image["content"] if og_image else None,
-            "type": link_type,
-        }
+def metadata_from_head(head: HeadMetadataParser, url: str) -> dict:
+    """
+    Поля ссылки из разобранного <head>: Open Graph, иначе <title> и meta description.
+    """
+    meta_title = head.og.get("og:title")
+    if meta_title is None:
+        meta_title = head.title if head.title is not None else url
+    meta_description = head.og.get("og:description")
+    if meta_description is None:
+        meta_description = head.description
+    return {
+        "title": meta_title,
+        "url": url,
+        "description": meta_description,
+        "image": head.og.get("og:image"),
+        "type": normalize_link_type(head.og.get("og:type")),
+    }
+
+
+async def _fetch_metadata(url: str):
+    started = time.perf_counter()
+    try:
+        async with stream(url) as response:
+            response.raise_for_status()
+            head = await parse_head(response, METADATA_MAX_BYTES)
 
+        result = metadata_from_head(head, url)
+        METADATA_FETCH_LATENCY.observe(time.perf_counter() - started, "ok")
         return result
     except Exception as e:
+        METADATA_FETCH_LATENCY.observe(time.perf_counter() - started, "error")
         raise HTTPException(status_code=400, detail=str(e))
\ No newline at end of file
@@ -12,14 +12,24 @@ create table if not exists links(
     user_id int not null,
     title text not null,
     description text,
-    url TEXT NOT NULL UNIQUE,
+    url TEXT NOT NULL,
+    url_hash BYTEA NOT NULL,
     image text,
     type TEXT DEFAULT 'website' CHECK (type IN ('website', 'book', 'article', 'music', 'video')),
+    status TEXT NOT NULL DEFAULT 'ready' CHECK (status IN ('pending', 'ready', 'failed')),
+    search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'B')
+    ) STORED,
     created_at TIMESTAMP default current_timestamp,
     updated_at timestamp default current_timestamp,
 
-    constraint fk_user foreign key (user_id) references users (id) on delete cascade
+    constraint fk_user foreign key (user_id) references users (id) on delete cascade,
+    constraint links_user_id_url_hash_key unique (user_id, url_hash)
 );
+create index if not exists ix_links_user_id_created_at_id on links (user_id, created_at, id);
+create index if not exists ix_links_search_vector on links using gin (search_vector);
+create index if not exists ix_links_pending on links (updated_at) where status = 'pending';
 
 drop table if exists collections;
 CREATE TABLE IF NOT EXISTS collections (
@@ -32,6 +42,8 @@ CREATE TABLE IF NOT EXISTS collections (
 
     CONSTRAINT fk_user FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_collections_user_id_created_at_id ON collections (user_id, created_at, id);
+CREATE INDEX IF NOT EXISTS ix_collections_user_id_name ON collections (user_id, name);
 
 DROP TABLE IF EXISTS collection_links;
 CREATE TABLE IF NOT EXISTS collection_links (
@@ -42,6 +54,7 @@ CREATE TABLE IF NOT EXISTS collection_links (
     CONSTRAINT fk_collection FOREIGN KEY (collection_id) REFERENCES collections(id) ON DELETE CASCADE,
     CONSTRAINT fk_link FOREIGN KEY (link_id) REFERENCES links(id) ON DELETE CASCADE
 );
+CREATE INDEX IF NOT EXISTS ix_collection_links_link_id ON collection_links (link_id);
 
 TRUNCATE TABLE users, links, collections, collection_links RESTART IDENTITY CASCADE;
 
@@ -90,12 +103,14 @@ BEGIN
 
     -- Создаём по одной ссылке каждого типа
     FOREACH type IN ARRAY types LOOP
-      INSERT INTO links (user_id, title, description, url, image, "type")
+      -- URL уже в каноническом виде, поэтому хэш можно посчитать в SQL
+      INSERT INTO links (user_id, title, description, url, url_hash, image, "type")
       VALUES (
         u_id,
         format('%s link for user %s', INITCAP(type), u_id),
         format('A test %s description for user %s', type, u_id),
         format('%s/%s/user%s', base_url, type, u_id),
+        sha256(convert_to(format('%s/%s/user%s', base_url, type, u_id), 'UTF8')),
         format('%s/img/%s_user%s.png', base_url, type, u_id),
         type
       )
@@ -116,4 +131,5 @@ CREATE TABLE IF NOT EXISTS password_tokens (
     expires_at TIMESTAMP NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (user_id) REFERENCES users(id)
-);
\ No newline at end of file
+);
+CREATE INDEX IF NOT EXISTS ix_password_tokens_expires_at ON password_tokens (expires_at);
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Пропускная способность GET /links/get_links при разном числе одновременных клиентов
+для версии до изменения (--before, например коммит перед переходом на asyncio) и одной
+или нескольких версий после (--ref, по умолчанию HEAD):
+
+    python -m benchmarks.concurrency --before <коммит до перехода на asyncio> --concurrency 1,4,16,64
+
+Каждая версия (любая ссылка git) извлекается через git archive во временный каталог
+и запускается через uvicorn с .env текущего каталога и той же БД. Пользователи и ссылки
+создаются текущей версией кода, поэтому схема БД должна быть обновлена до последней миграции.
+Версии до перехода на проверку токена без HTTP запроса проверяют токен запросом к BASE_URL/me,
+поэтому BASE_URL указывается на запущенный экземпляр.
+
+Для каждой версии и уровня параллельности выводятся rps, p50/p95 и число ошибок
+(таймауты и ответы с кодом >= 400).
+"""
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from app.database import engine
+from benchmarks.loadtest import ROOT, _free_port, cleanup, login, percentile, seed, start_server, wait_ready
+
+
+def extract(ref: str, target: Path) -> str:
+    """Извлекает дерево ref в target и возвращает короткий хэш коммита."""
+    commit = subprocess.run(["git", "rev-parse", "--short", ref], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout.strip()
+    archive = subprocess.run(["git", "archive", "--format=tar", commit], cwd=ROOT, capture_output=True,
+                             check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(target, filter="data")
+    return commit
+
+
+async def measure(client: httpx.AsyncClient, tokens: list[str], concurrency: int, duration: float,
+                  limit: int) -> dict:
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(number: int):
+        nonlocal errors
+        headers = {"Authorization": f"Bearer {tokens[number % len(tokens)]}"}
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                response = await client.get("/links/get_links", params={"limit": limit}, headers=headers)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            if failed:
+                errors += 1
+            else:
+                latencies.append(time.monotonic() - started)
+
+    started = time.monotonic()
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.monotonic() - started
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+    }
+
+
+async def run_ref(ref: str, users: list, levels: list[int], args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(prefix="concurrency-") as directory:
+        commit = extract(ref, Path(directory))
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.workers, root=Path(directory), env={"BASE_URL": base_url})
+        try:
+            limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                await wait_ready(client)
+                for user in users:
+                    (await login(client, user)).raise_for_status()
+                tokens = [user.token for user in users]
+                # Прогрев: соединения с БД и импорты
+                await measure(client, tokens, 1, min(args.duration, 2), args.links)
+                results = []
+                for level in levels:
+                    result = await measure(client, tokens, level, args.duration, args.links)
+                    print(f"{ref:>12} {commit:>9} {level:>8} {result['rps']:>9.1f} {result['p50_ms']:>9.1f} "
+                          f"{result['p95_ms']:>9.1f} {result['errors']:>7}")
+                    results.append(result)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    return {"ref": ref, "commit": commit, "levels": results}
+
+
+async def run(args: argparse.Namespace) -> int:
+    levels = [int(value) for value in args.concurrency.split(",")]
+    users = await seed(args.users, args.links, 0)
+    try:
+        print(f"{'версия':>12} {'коммит':>9} {'клиентов':>8} {'rps':>9} {'p50 мс':>9} {'p95 мс':>9} {'ошибок':>7}")
+        results = [await run_ref(ref, users, levels, args) for ref in [args.before, *(args.ref or ["HEAD"])]]
+    finally:
+        await cleanup(args.users)
+        await engine.dispose()
+    if args.output:
+        Path(args.output).write_text(json.dumps({
+            "started_at": datetime.datetime.utcnow().isoformat(),
+            "users": args.users,
+            "links": args.links,
+            "duration": args.duration,
+            "workers": args.workers,
+            "results": results,
+        }, ensure_ascii=False, indent=2))
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Пропускная способность get_links для нескольких версий")
+    parser.add_argument("--before", required=True, help="Версия до изменения (ссылка git), с ней сравниваются остальные")
+    parser.add_argument("--ref", action="append", help="Версия после изменения (ссылка git), можно несколько; по умолчанию HEAD")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Уровни параллельности через запятую")
+    parser.add_argument("--duration", type=float, default=10, help="Длительность замера на уровень, сек")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--links", type=int, default=50,
+                        help="Ссылок у пользователя; столько же запрашивается за раз, чтобы версии "
+                             "без пагинации возвращали те же данные")
+    parser.add_argument("--timeout", type=float, default=10, help="Таймаут запроса, сек")
+    parser.add_argument("--workers", type=int, default=1, help="Процессов uvicorn")
+    parser.add_argument("--output", help="Файл для результата в JSON")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,54 @@
+"""
+Локальный сайт для нагрузочного теста: на любой путь отдаёт страницу с Open Graph метаданными,
+чтобы /links/create_link не зависел от внешней сети.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE = """<!DOCTYPE html>
+<html>
+<head>
+    <meta property="og:title" content="Benchmark page {path}">
+    <meta property="og:description" content="Страница для нагрузочного теста">
+    <meta property="og:image" content="http://{host}/image.png">
+    <meta property="og:type" content="article">
+    <title>Benchmark page {path}</title>
+</head>
+<body><p>{path}</p></body>
+</html>
+"""
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = PAGE.format(path=self.path, host=self.headers.get("Host", "")).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSite:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def __enter__(self) -> "FakeSite":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,143 @@
+"""
+Сравнение извлечения метаданных страницы: прежний путь (весь ответ в память, BeautifulSoup
+по всему документу) и потоковый parse_head, который читает ответ порциями до конца <head>.
+
+Сначала проверяется, что оба способа дают одинаковые поля ссылки; при расхождении код возврата 1.
+Прежний путь требует BeautifulSoup, которого нет в requirements.txt:
+
+    pip install beautifulsoup4
+    python -m benchmarks.head_parser --repeat 20
+
+Страницы синтетические, сеть не нужна: тело ответа отдаётся порциями по --chunk-size байт.
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+import httpx
+
+from app.head_parser import parse_head
+from app.utils import DEFAULT_LINK_TYPE, METADATA_MAX_BYTES, metadata_from_head, normalize_link_type
+
+URL = "https://example.com/page"
+
+
+class _ChunkedStream(httpx.AsyncByteStream):
+    """Тело ответа порциями, как при чтении из сети."""
+
+    def __init__(self, body: bytes, chunk_size: int):
+        self.body = body
+        self.chunk_size = chunk_size
+
+    async def __aiter__(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            yield self.body[start:start + self.chunk_size]
+
+
+def _page(head: str, body_bytes: int) -> str:
+    paragraph = "<p>Текст статьи, <a href='/x'>ссылка</a> &amp; <b>выделение</b>.</p>\n"
+    body = paragraph * (body_bytes // len(paragraph.encode()) + 1)
+    return f"<!DOCTYPE html>\n<html>\n<head>\n{head}\n</head>\n<body>\n{body}</body>\n</html>\n"
+
+
+OG_HEAD = """<meta charset="utf-8">
+<title>Заголовок &laquo;страницы&raquo;</title>
+<meta name="description" content="Обычное описание">
+<meta property="og:title" content="OG заголовок &amp; кавычки &quot;">
+<meta property="og:description" content="OG описание">
+<meta property="og:image" content="https://example.com/image.png">
+<meta property="og:type" content="video.other">"""
+
+PLAIN_HEAD = """<meta charset="utf-8">
+<title>Только title</title>
+<meta name="description" content="Описание без Open Graph">"""
+
+# <meta charset> далеко от начала документа: в первую порцию из сети не попадает
+LATE_CHARSET_HEAD = "\n".join(f'<link rel="preload" href="/static/{i}.js">' for i in range(40)) + """
+<meta charset="windows-1251">
+<title>Кириллица в windows-1251</title>"""
+
+# (название, страница, кодировка страницы, Content-Type)
+CASES = (
+    ("og, 10 КБ", _page(OG_HEAD, 10 * 1024), "utf-8", "text/html"),
+    ("title, 10 КБ", _page(PLAIN_HEAD, 10 * 1024), "utf-8", "text/html; charset=utf-8"),
+    ("og, 5 МБ", _page(OG_HEAD, 5 * 1024 * 1024), "utf-8", "text/html"),
+    ("windows-1251, 2 МБ", _page(LATE_CHARSET_HEAD, 2 * 1024 * 1024), "windows-1251", "text/html"),
+)
+
+
+def _response(body: bytes, content_type: str, chunk_size: int) -> httpx.Response:
+    return httpx.Response(200, headers={"Content-Type": content_type}, stream=_ChunkedStream(body, chunk_size))
+
+
+def soup_metadata(body: bytes, content_type: str, encoding: str) -> dict:
+    """Прежний get_metadata_from_link: декодирование всего ответа и BeautifulSoup по всему документу."""
+    from bs4 import BeautifulSoup
+
+    response = httpx.Response(200, headers={"Content-Type": content_type}, content=body, default_encoding=encoding)
+    soup = BeautifulSoup(response.text, "html.parser")
+
+    og_title = soup.find("meta", attrs={"property": "og:title"})
+    og_description = soup.find("meta", attrs={"property": "og:description"})
+    og_image = soup.find("meta", attrs={"property": "og:image"})
+    og_type = soup.find("meta", attrs={"property": "og:type"})
+
+    meta_title = soup.find("title")
+    meta_description = soup.find("meta", attrs={"name": "description"})
+
+    link_type = DEFAULT_LINK_TYPE
+    if og_type:
+        link_type = normalize_link_type(og_type.get("content"))
+
+    return {
+        "title": og_title["content"] if og_title else meta_title.text if meta_title else URL,
+        "url": URL,
+        "description": og_description["content"] if og_description else meta_description["content"] if meta_description else None,
+        "image": og_image["content"] if og_image else None,
+        "type": link_type,
+    }
+
+
+async def stream_metadata(body: bytes, content_type: str, chunk_size: int) -> dict:
+    head = await parse_head(_response(body, content_type, chunk_size), METADATA_MAX_BYTES)
+    return metadata_from_head(head, URL)
+
+
+def _best(func, repeat: int) -> tuple[float, dict]:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк извлечения метаданных страницы")
+    parser.add_argument("--repeat", type=int, default=10, help="Повторов на страницу, берётся лучшее время")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="Размер порции тела ответа, байт")
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    print(f"{'страница':>20} {'bs4, мс':>10} {'поток, мс':>10} {'ускорение':>10}")
+    failed = False
+    for name, page, encoding, content_type in CASES:
+        body = page.encode(encoding)
+        slow, expected = _best(lambda: soup_metadata(body, content_type, encoding), args.repeat)
+        fast, actual = _best(
+            lambda: loop.run_until_complete(stream_metadata(body, content_type, args.chunk_size)), args.repeat
+        )
+        if actual != expected:
+            print(f"{name}: результаты различаются\n  bs4:   {expected}\n  поток: {actual}")
+            failed = True
+            continue
+        print(f"{name:>20} {slow * 1000:>10.2f} {fast * 1000:>10.2f} {slow / fast:>9.1f}x")
+    loop.run_until_complete(loop.shutdown_asyncgens())
+    loop.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
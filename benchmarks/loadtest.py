@@ -0,0 +1,387 @@
+"""
+Нагрузочный тест API.
+
+Запускает приложение из main.py через uvicorn, создаёт в БД пользователей, ссылки и коллекции,
+воспроизводит заданную смесь запросов и сохраняет пропускную способность и перцентили
+задержки по каждому маршруту в JSON.
+
+    python -m benchmarks.loadtest run --users 50 --duration 30 --concurrency 32 --output new.json
+    python -m benchmarks.loadtest compare base.json new.json --threshold 0.1
+
+БД берётся из тех же переменных окружения (.env), что и у приложения.
+compare завершается с кодом 1, если p95 какого-либо маршрута вырос или пропускная способность
+упала больше чем на threshold.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Optional
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+from app.database import engine
+from app.models import Collections, Links, PasswordResetToken, Users
+from app.utils import hash_password, hash_url
+from benchmarks.fake_site import FakeSite
+
+ROOT = Path(__file__).resolve().parent.parent
+EMAIL_TEMPLATE = "loadtest-user{}@example.com"
+PASSWORD = "loadtest-password"
+DEFAULT_MIX = "login=1,get_links=10,create_link=2,collection_add=2,collection_remove=2"
+ROUTES = {
+    "login": "POST /auth/login",
+    "get_links": "GET /links/get_links",
+    "create_link": "POST /links/create_link",
+    "collection_add": "POST /collections/add_link",
+    "collection_remove": "POST /collections/remove_link",
+}
+
+
+class UserState:
+    """Состояние пользователя на стороне клиента: какие ссылки сейчас лежат в каких коллекциях."""
+
+    def __init__(self, email: str, urls: list[str], collections: list[str]):
+        self.email = email
+        self.token: Optional[str] = None
+        self.outside = {name: set(urls) for name in collections}
+        self.inside = {name: set() for name in collections}
+        self.created = 0
+
+
+def parse_mix(value: str) -> dict[str, float]:
+    mix = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise argparse.ArgumentTypeError(f"Неизвестная операция {name}, допустимые: {', '.join(ROUTES)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+async def seed(users: int, links: int, collections: int) -> list[UserState]:
+    """
+    Пересоздаёт пользователей нагрузочного теста. У всех пользователей один пароль,
+    поэтому bcrypt выполняется один раз.
+    """
+    await cleanup(users)
+    password_hash = hash_password(PASSWORD)
+    now = datetime.datetime.utcnow()
+    states = []
+    async with engine.begin() as conn:
+        user_ids = (await conn.execute(
+            insert(Users).returning(Users.id),
+            [{"email": EMAIL_TEMPLATE.format(i), "password_hash": password_hash} for i in range(users)],
+        )).scalars().all()
+        for i, user_id in enumerate(user_ids):
+            urls = [f"https://loadtest.example.com/u{user_id}/{n}" for n in range(links)]
+            names = [f"Collection {n}" for n in range(collections)]
+            if urls:
+                await conn.execute(insert(Links), [
+                    {"user_id": user_id, "title": url, "url": url, "url_hash": hash_url(url), "type": "website",
+                     "created_at": now, "updated_at": now} for url in urls
+                ])
+            if names:
+                await conn.execute(insert(Collections), [
+                    {"user_id": user_id, "name": name, "created_at": now, "updated_at": now} for name in names
+                ])
+            states.append(UserState(EMAIL_TEMPLATE.format(i), urls, names))
+    return states
+
+
+async def cleanup(users: int):
+    emails = [EMAIL_TEMPLATE.format(i) for i in range(users)]
+    async with engine.begin() as conn:
+        user_ids = select(Users.id).where(Users.email.in_(emails)).scalar_subquery()
+        await conn.execute(delete(PasswordResetToken).where(PasswordResetToken.user_id.in_(user_ids)))
+        # Ссылки и коллекции удаляются каскадно
+        await conn.execute(delete(Users).where(Users.email.in_(emails)))
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(port: int, workers: int, root: Path = ROOT, env: Optional[dict] = None) -> subprocess.Popen:
+    """
+    Запускает main:app из каталога root (по умолчанию из этого репозитория).
+    Рабочий каталог, а значит и .env, остаётся текущим.
+    """
+    env = {**os.environ, **(env or {})}
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(root), env.get("PYTHONPATH")]))
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--app-dir", str(root)],
+        env=env,
+    )
+
+
+async def wait_ready(client: httpx.AsyncClient, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            if (await client.get("/openapi.json")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        if time.monotonic() > deadline:
+            raise RuntimeError("Приложение не запустилось")
+        await asyncio.sleep(0.2)
+
+
+async def login(client: httpx.AsyncClient, user: UserState) -> httpx.Response:
+    response = await client.post("/auth/login", data={"username": user.email, "password": PASSWORD})
+    if response.status_code == 200:
+        user.token = response.json()["access_token"]
+    return response
+
+
+async def operation(name: str, client: httpx.AsyncClient, user: UserState, site: str,
+                    rng: random.Random) -> Optional[httpx.Response]:
+    """
+    Выполняет одну операцию. Состояние коллекций меняется до запроса, поэтому параллельные
+    воркеры не добавляют одну и ту же ссылку дважды. Возвращает None, если операцию выполнить нельзя.
+    """
+    if name == "login":
+        return await login(client, user)
+
+    headers = {"Authorization": f"Bearer {user.token}"}
+    if name == "get_links":
+        return await client.get("/links/get_links", params={"limit": 50}, headers=headers)
+    if name == "create_link":
+        user.created += 1
+        url = f"{site}/{user.email.split('@')[0]}/{user.created}"
+        return await client.post("/links/create_link", params={"url": url}, headers=headers)
+
+    if name == "collection_add":
+        source, target = user.outside, user.inside
+        path = "/collections/add_link"
+    else:
+        source, target = user.inside, user.outside
+        path = "/collections/remove_link"
+    candidates = [collection for collection, urls in source.items() if urls]
+    if not candidates:
+        return None
+    collection = rng.choice(candidates)
+    url = rng.choice(sorted(source[collection]))
+    source[collection].discard(url)
+    target[collection].add(url)
+    response = await client.post(path, params={"url": url, "name": collection}, headers=headers)
+    if response.status_code != 200:
+        target[collection].discard(url)
+        source[collection].add(url)
+    return response
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+def summarize(samples: dict[str, list[float]], errors: dict[str, int], statuses: dict[str, dict],
+              duration: float) -> dict:
+    routes = {}
+    for name, latencies in sorted(samples.items()):
+        latencies.sort()
+        routes[ROUTES[name]] = {
+            "requests": len(latencies),
+            "errors": errors[name],
+            "statuses": dict(sorted(statuses[name].items())),
+            "rps": round(len(latencies) / duration, 2),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+            "max_ms": round(latencies[-1] * 1000, 2),
+        }
+    total = sum(len(latencies) for latencies in samples.values())
+    return {
+        "routes": routes,
+        "total": {
+            "requests": total,
+            "errors": sum(errors.values()),
+            "rps": round(total / duration, 2),
+        },
+    }
+
+
+async def replay(client: httpx.AsyncClient, users: list[UserState], site: str, mix: dict[str, float],
+                 args: argparse.Namespace) -> dict:
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    statuses = defaultdict(lambda: defaultdict(int))
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    started = time.monotonic()
+    measure_from = started + args.warmup
+    deadline = measure_from + args.duration
+
+    async def worker(number: int):
+        rng = random.Random(args.seed * 1000 + number)
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            user = rng.choice(users)
+            request_started = time.monotonic()
+            try:
+                response = await operation(name, client, user, site, rng)
+                if response is None:
+                    continue
+                status = str(response.status_code)
+                failed = response.status_code >= 400
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+                failed = True
+            finished = time.monotonic()
+            if request_started < measure_from:
+                continue
+            samples[name].append(finished - request_started)
+            statuses[name][status] += 1
+            errors[name] += failed
+
+    await asyncio.gather(*(worker(number) for number in range(args.concurrency)))
+    return summarize(samples, errors, statuses, time.monotonic() - measure_from)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args: argparse.Namespace) -> int:
+    mix = parse_mix(args.mix)
+    print(f"Создаются данные: {args.users} пользователей, по {args.links} ссылок и {args.collections} коллекций")
+    users = await seed(args.users, args.links, args.collections)
+
+    server = None
+    base_url = args.url
+    if not base_url:
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.workers)
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        with FakeSite() as site:
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+                await wait_ready(client)
+                semaphore = asyncio.Semaphore(8)
+
+                async def first_login(user: UserState):
+                    async with semaphore:
+                        (await login(client, user)).raise_for_status()
+
+                await asyncio.gather(*(first_login(user) for user in users))
+                print(f"Нагрузка: {args.concurrency} клиентов, {args.duration} с (прогрев {args.warmup} с)")
+                result = await replay(client, users, site.base_url, mix, args)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        if not args.keep:
+            await cleanup(args.users)
+        await engine.dispose()
+
+    result["meta"] = {
+        "started_at": datetime.datetime.utcnow().isoformat(),
+        "commit": _git_commit(),
+        "url": args.url,
+        "workers": args.workers,
+        "users": args.users,
+        "links": args.links,
+        "collections": args.collections,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "warmup": args.warmup,
+        "mix": mix,
+        "seed": args.seed,
+    }
+    print_report(result)
+    if args.output:
+        Path(args.output).write_text(json.dumps(result, ensure_ascii=False, indent=2))
+        print(f"Результат сохранён в {args.output}")
+    return 0
+
+
+def print_report(result: dict):
+    print(f"{'маршрут':<32} {'запросов':>9} {'ошибок':>7} {'rps':>9} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}")
+    for route, stats in result["routes"].items():
+        print(f"{route:<32} {stats['requests']:>9} {stats['errors']:>7} {stats['rps']:>9.1f} "
+              f"{stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} {stats['p99_ms']:>9.1f}")
+    total = result["total"]
+    print(f"{'всего':<32} {total['requests']:>9} {total['errors']:>7} {total['rps']:>9.1f}")
+
+
+def compare(args: argparse.Namespace) -> int:
+    base = json.loads(Path(args.base).read_text())
+    new = json.loads(Path(args.new).read_text())
+    regressions = 0
+    print(f"{'маршрут':<32} {'rps':>18} {'p50 мс':>18} {'p95 мс':>18} {'p99 мс':>18}")
+    for route, stats in new["routes"].items():
+        old = base["routes"].get(route)
+        if old is None:
+            print(f"{route:<32} нет в {args.base}")
+            continue
+        cells = []
+        for key in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            change = (stats[key] - old[key]) / old[key] if old[key] else 0.0
+            cells.append(f"{old[key]:.1f}→{stats[key]:.1f} {change:+.0%}".rjust(18))
+        rps_drop = (old["rps"] - stats["rps"]) / old["rps"] if old["rps"] else 0.0
+        p95_growth = (stats["p95_ms"] - old["p95_ms"]) / old["p95_ms"] if old["p95_ms"] else 0.0
+        mark = ""
+        if rps_drop > args.threshold or p95_growth > args.threshold:
+            regressions += 1
+            mark = "  регрессия"
+        print(f"{route:<32} {' '.join(cells)}{mark}")
+    return 1 if regressions else 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Запустить нагрузочный тест")
+    run_parser.add_argument("--users", type=int, default=20)
+    run_parser.add_argument("--links", type=int, default=100, help="Ссылок у каждого пользователя")
+    run_parser.add_argument("--collections", type=int, default=5, help="Коллекций у каждого пользователя")
+    run_parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Веса операций, по умолчанию {DEFAULT_MIX}")
+    run_parser.add_argument("--concurrency", type=int, default=32, help="Одновременных клиентов")
+    run_parser.add_argument("--duration", type=float, default=30, help="Длительность замера, сек")
+    run_parser.add_argument("--warmup", type=float, default=5, help="Прогрев перед замером, сек")
+    run_parser.add_argument("--timeout", type=float, default=30, help="Таймаут запроса, сек")
+    run_parser.add_argument("--workers", type=int, default=1, help="Процессов uvicorn")
+    run_parser.add_argument("--url", help="Адрес уже запущенного приложения (иначе оно запускается)")
+    run_parser.add_argument("--seed", type=int, default=1, help="Seed генератора смеси запросов")
+    run_parser.add_argument("--output", help="Файл для результата в JSON")
+    run_parser.add_argument("--keep", action="store_true", help="Не удалять созданные данные")
+
+    compare_parser = commands.add_parser("compare", help="Сравнить два результата")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Допустимое ухудшение rps и p95, доля (0.1 = 10%%)")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return asyncio.run(run(args))
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
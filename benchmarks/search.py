@@ -0,0 +1,102 @@
+"""
+Время поиска /links/search (полнотекстовый индекс по search_vector) в сравнении с ILIKE
+по заголовку и описанию тех же ссылок пользователя.
+
+Данные готовятся заранее генератором, например 1 000 000 ссылок у 1000 пользователей:
+
+    python -m benchmarks.seed --users 1000 --links 1000 --collections 0 --rebuild-indexes
+    python -m benchmarks.search --repeat 5
+
+Поиск выполняется тем же запросом, что строит обработчик (app.routers.links.search_query),
+для самого активного пользователя или для --user-id. Запросы подобраны по частоте слов
+в данных генератора: от слова почти в каждой второй ссылке до отсутствующего слова.
+ILIKE ищет подстроку, а не слово, поэтому число найденных строк может немного отличаться.
+Для каждого запроса берётся лучшее время из --repeat повторов (данные уже в кэше).
+"""
+import argparse
+import asyncio
+import sys
+import time
+
+from sqlalchemy import and_, func, or_, select
+
+from app.database import engine
+from app.models import Links
+from app.routers.links import SEARCH_CUSTOM_PLAN, search_query
+
+# (запрос /links/search, подстроки, которые ILIKE ищет одновременно)
+CASES = (
+    ("python", ("python",)),
+    ("python postgres", ("python", "postgres")),
+    ('"python postgres"', ("python postgres",)),
+    ("python postgres fastapi async", ("python", "postgres", "fastapi", "async")),
+    ("nonexistentword", ("nonexistentword",)),
+)
+
+
+def ilike_query(user_id: int, patterns: tuple[str, ...], limit: int):
+    """Поиск без индекса: каждая подстрока должна встретиться в заголовке или описании."""
+    return (
+        select(Links)
+        .where(Links.user_id == user_id)
+        .where(and_(*(or_(Links.title.ilike(f"%{p}%"), Links.description.ilike(f"%{p}%")) for p in patterns)))
+        .order_by(Links.created_at.desc(), Links.id.desc())
+        .limit(limit + 1)
+    )
+
+
+def count_query(stmt):
+    """Сколько всего строк подходит под запрос, без limit и сортировки."""
+    return select(func.count()).select_from(stmt.limit(None).order_by(None).subquery())
+
+
+async def _best(conn, stmt, repeat: int) -> tuple[float, int]:
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = (await conn.execute(stmt)).all()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, len(rows)
+
+
+async def run(args: argparse.Namespace) -> int:
+    async with engine.connect() as conn:
+        total = (await conn.execute(select(func.count()).select_from(Links))).scalar()
+        user_id = args.user_id
+        if user_id is None:
+            user_id = (await conn.execute(
+                select(Links.user_id).group_by(Links.user_id).order_by(func.count().desc()).limit(1)
+            )).scalar()
+        if user_id is None:
+            print("В таблице links нет данных, сначала запустите python -m benchmarks.seed")
+            return 1
+        user_links = (await conn.execute(select(func.count()).where(Links.user_id == user_id))).scalar()
+        # Как в обработчике /links/search; ILIKE в той же транзакции тоже планируется заново
+        await conn.execute(SEARCH_CUSTOM_PLAN)
+        print(f"ссылок всего: {total}, у пользователя {user_id}: {user_links}, limit {args.limit}")
+
+        print(f"{'запрос':>32} {'найдено':>9} {'поиск, мс':>10} {'ilike':>9} {'ILIKE, мс':>10} {'ускорение':>10}")
+        for q, patterns in CASES:
+            search = search_query(user_id, q, args.limit)
+            ilike = ilike_query(user_id, patterns, args.limit)
+            fast, _ = await _best(conn, search, args.repeat)
+            slow, _ = await _best(conn, ilike, args.repeat)
+            found = (await conn.execute(count_query(search))).scalar()
+            found_ilike = (await conn.execute(count_query(ilike))).scalar()
+            print(f"{q:>32} {found:>9} {fast * 1000:>10.2f} {found_ilike:>9} {slow * 1000:>10.2f} "
+                  f"{slow / fast:>9.1f}x")
+    await engine.dispose()
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк полнотекстового поиска по ссылкам")
+    parser.add_argument("--user-id", type=int, help="Пользователь, по умолчанию тот, у кого больше всего ссылок")
+    parser.add_argument("--limit", type=int, default=50, help="Размер страницы")
+    parser.add_argument("--repeat", type=int, default=5, help="Повторов на запрос, берётся лучшее время")
+    return asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
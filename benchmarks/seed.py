@@ -0,0 +1,258 @@
+"""
+Генератор больших наборов данных: пользователи, ссылки, коллекции и collection_links.
+
+Распределение неравномерное: количество ссылок и коллекций у пользователя убывает
+по закону Ципфа (--skew), поэтому есть несколько очень активных пользователей и длинный хвост.
+Строки передаются через COPY FROM STDIN пачками по --batch строк, поэтому память
+не зависит от объёма данных.
+
+    python -m benchmarks.seed --users 100000 --links 100 --collections 5 --links-per-collection 20
+
+--links, --collections и --links-per-collection задают средние значения на пользователя
+(на коллекцию). Все пользователи получают пароль --password. Загрузка идёт одной транзакцией:
+на время загрузки id таблиц переводятся в GENERATED BY DEFAULT, чтобы сразу связывать строки
+по заранее известным id, затем последовательности сдвигаются на max(id).
+С --rebuild-indexes вторичные индексы удаляются на время загрузки и строятся один раз в конце.
+"""
+import argparse
+import datetime
+import hashlib
+import io
+import random
+import sys
+import time
+from typing import Iterable, Iterator
+
+import psycopg2
+
+from app.database import SQLALCHEMY_DATABASE_URL
+from app.utils import hash_password
+
+TABLES = ("users", "links", "collections")
+LINK_TYPES = ("website", "book", "article", "music", "video")
+WORDS = (
+    "python", "postgres", "fastapi", "async", "index", "cache", "queue", "search", "music", "video",
+    "article", "guide", "news", "review", "tutorial", "recipe", "travel", "science", "history", "design",
+    "linux", "network", "database", "performance", "security", "book", "podcast", "interview", "release",
+)
+# Период, за который равномерно распределяется created_at
+HISTORY = datetime.timedelta(days=365)
+
+
+def zipf_counts(total: int, buckets: int, skew: float) -> list[int]:
+    """
+    Делит total на buckets частей с весами 1 / rank ** skew. Первые части самые большие.
+    """
+    if buckets <= 0:
+        return []
+    weights = [1 / (rank ** skew) for rank in range(1, buckets + 1)]
+    scale = total / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    # Остаток от округления раздаём по одному, начиная с крупных
+    for i in range(total - sum(counts)):
+        counts[i % buckets] += 1
+    return counts
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def _timestamp(start: datetime.datetime, position: int, total: int) -> str:
+    return (start + HISTORY * (position / max(total, 1))).isoformat(sep=" ")
+
+
+def copy_rows(cursor, table: str, columns: tuple[str, ...], rows: Iterable[tuple], batch: int) -> int:
+    """
+    Отправляет строки в таблицу через COPY FROM STDIN пачками по batch строк.
+    Значения не должны содержать табуляцию, перевод строки и обратную косую черту.
+    """
+    sql = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    buffer = io.StringIO()
+    pending = 0
+    count = 0
+    for row in rows:
+        buffer.write("\t".join(r"\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+        pending += 1
+        if pending >= batch:
+            buffer.seek(0)
+            cursor.copy_expert(sql, buffer)
+            count += pending
+            buffer = io.StringIO()
+            pending = 0
+    if pending:
+        buffer.seek(0)
+        cursor.copy_expert(sql, buffer)
+        count += pending
+    return count
+
+
+def _drop_indexes(cursor) -> list[str]:
+    """
+    Удаляет вторичные индексы (не первичные ключи и не ограничения уникальности)
+    и возвращает их определения, чтобы построить заново после загрузки.
+    """
+    cursor.execute(
+        "SELECT indexname, indexdef FROM pg_indexes"
+        " WHERE schemaname = current_schema() AND tablename = ANY(%s)"
+        " AND indexname NOT IN (SELECT conname FROM pg_constraint)",
+        (list((*TABLES, "collection_links")),),
+    )
+    indexes = cursor.fetchall()
+    for name, _ in indexes:
+        cursor.execute(f"DROP INDEX {name}")
+    return [definition for _, definition in indexes]
+
+
+def _next_ids(cursor) -> dict[str, int]:
+    ids = {}
+    for table in TABLES:
+        cursor.execute(f"SELECT coalesce(max(id), 0) + 1 FROM {table}")
+        ids[table] = cursor.fetchone()[0]
+    return ids
+
+
+def generate_users(first_id: int, count: int, password_hash: str) -> Iterator[tuple]:
+    for user_id in range(first_id, first_id + count):
+        yield user_id, f"seed{user_id}@example.com", password_hash
+
+
+def generate_links(first_user: int, first_link: int, link_counts: list[int], rng: random.Random,
+                   start: datetime.datetime) -> Iterator[tuple]:
+    total = sum(link_counts)
+    link_id = first_link
+    for offset, count in enumerate(link_counts):
+        user_id = first_user + offset
+        for n in range(count):
+            # URL уже канонический (см. app.utils.canonicalize_url), поэтому хэш считается от него напрямую
+            url = f"https://site{rng.randrange(1000)}.example.com/u{user_id}/{n}"
+            url_hash = hashlib.sha256(url.encode()).hexdigest()
+            created_at = _timestamp(start, link_id - first_link, total)
+            yield (link_id, user_id, _text(rng, rng.randint(2, 6)), _text(rng, rng.randint(5, 20)), url,
+                   rf"\\x{url_hash}", rng.choice(LINK_TYPES), "ready", created_at, created_at)
+            link_id += 1
+
+
+def generate_collections(first_user: int, first_collection: int, collection_counts: list[int],
+                         start: datetime.datetime) -> Iterator[tuple]:
+    total = sum(collection_counts)
+    collection_id = first_collection
+    for offset, count in enumerate(collection_counts):
+        for n in range(count):
+            created_at = _timestamp(start, collection_id - first_collection, total)
+            yield (collection_id, first_user + offset, f"Collection {n}", f"Generated collection {n}",
+                   created_at, created_at)
+            collection_id += 1
+
+
+def generate_collection_links(first_link: int, first_collection: int, link_counts: list[int],
+                              collection_counts: list[int], per_collection: int,
+                              rng: random.Random) -> Iterator[tuple]:
+    """
+    В коллекцию попадают только ссылки её владельца. Размер коллекции случайный,
+    в среднем per_collection, но не больше числа ссылок пользователя.
+    """
+    link_start = first_link
+    collection_id = first_collection
+    for links, collections in zip(link_counts, collection_counts):
+        for _ in range(collections):
+            size = min(links, int(rng.expovariate(1 / per_collection))) if per_collection and links else 0
+            for link_id in sorted(rng.sample(range(link_start, link_start + links), size)):
+                yield collection_id, link_id
+            collection_id += 1
+        link_start += links
+
+
+def _report(table: str, rows: int, started: float):
+    elapsed = time.perf_counter() - started
+    print(f"{table:<17} {rows:>12} строк {elapsed:>8.1f} с {rows / elapsed if elapsed else 0:>10.0f} строк/с")
+
+
+def seed(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    link_counts = zipf_counts(args.users * args.links, args.users, args.skew)
+    collection_counts = zipf_counts(args.users * args.collections, args.users, args.skew)
+    start = datetime.datetime.utcnow() - HISTORY
+    password_hash = hash_password(args.password)
+
+    conn = psycopg2.connect(SQLALCHEMY_DATABASE_URL.replace("+asyncpg", ""))
+    try:
+        with conn, conn.cursor() as cursor:
+            for table in TABLES:
+                cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+            ids = _next_ids(cursor)
+            for table in TABLES:
+                cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET GENERATED BY DEFAULT")
+            indexes = _drop_indexes(cursor) if args.rebuild_indexes else []
+
+            started = time.perf_counter()
+            rows = copy_rows(cursor, "users", ("id", "email", "password_hash"),
+                             generate_users(ids["users"], args.users, password_hash), args.batch)
+            _report("users", rows, started)
+
+            started = time.perf_counter()
+            rows = copy_rows(
+                cursor, "links",
+                ("id", "user_id", "title", "description", "url", "url_hash", "type", "status",
+                 "created_at", "updated_at"),
+                generate_links(ids["users"], ids["links"], link_counts, rng, start), args.batch,
+            )
+            _report("links", rows, started)
+
+            started = time.perf_counter()
+            rows = copy_rows(
+                cursor, "collections", ("id", "user_id", "name", "description", "created_at", "updated_at"),
+                generate_collections(ids["users"], ids["collections"], collection_counts, start), args.batch,
+            )
+            _report("collections", rows, started)
+
+            started = time.perf_counter()
+            rows = copy_rows(
+                cursor, "collection_links", ("collection_id", "link_id"),
+                generate_collection_links(ids["links"], ids["collections"], link_counts, collection_counts,
+                                          args.links_per_collection, rng),
+                args.batch,
+            )
+            _report("collection_links", rows, started)
+
+            started = time.perf_counter()
+            for definition in indexes:
+                cursor.execute(definition)
+            if indexes:
+                print(f"{len(indexes)} индексов построено за {time.perf_counter() - started:.1f} с")
+
+            for table in TABLES:
+                cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET GENERATED ALWAYS")
+                cursor.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), (SELECT max(id) FROM {table}))"
+                )
+        # ANALYZE после commit, чтобы планировщик сразу знал о новых данных
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            for table in (*TABLES, "collection_links"):
+                cursor.execute(f"ANALYZE {table}")
+    finally:
+        conn.close()
+    print(f"Пользователи с id от {ids['users']}, самый активный: seed{ids['users']}@example.com, "
+          f"пароль {args.password}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Генератор данных через COPY")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--links", type=int, default=100, help="Ссылок на пользователя в среднем")
+    parser.add_argument("--collections", type=int, default=5, help="Коллекций на пользователя в среднем")
+    parser.add_argument("--links-per-collection", type=int, default=20, help="Ссылок в коллекции в среднем")
+    parser.add_argument("--skew", type=float, default=1.0, help="Показатель Ципфа, 0 — равномерно")
+    parser.add_argument("--batch", type=int, default=50000, help="Строк в одной команде COPY")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--password", default="seed-password")
+    parser.add_argument("--rebuild-indexes", action="store_true",
+                        help="Удалить вторичные индексы на время загрузки и построить их после (быстрее для больших объёмов)")
+    seed(parser.parse_args())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
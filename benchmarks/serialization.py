@@ -0,0 +1,87 @@
+"""
+Сравнение сериализации страницы ссылок: через pydantic (LinkPage, как FastAPI сериализует
+response_model) и быстрый путь render_link_page (строки Core + orjson).
+
+Совпадение результата байт в байт проверяет tests/test_link_serialization.py;
+здесь для надёжности сравниваются и сгенерированные страницы, при расхождении код возврата 1.
+
+    python -m benchmarks.serialization --sizes 10000,100000,1000000
+
+Данные синтетические, БД не нужна. В обработчике быстрый путь дополнительно экономит
+создание ORM объектов при чтении строк из БД, здесь это не учитывается.
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+
+from app.routers.links import LINK_FIELDS, render_link_page
+from app.schemas import LinkPage
+
+
+class _Attributes:
+    """Объект с атрибутами строки, как ORM объект Links для from_attributes."""
+
+    def __init__(self, row: tuple):
+        for field, value in zip(LINK_FIELDS, row):
+            setattr(self, field, value)
+
+
+def make_rows(count: int, seed: int = 1) -> list[tuple]:
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    titles = ("Заголовок страницы", 'Title with "quotes" and \\ backslash', "emoji 🚀 tab\tnewline\n", "plain")
+    rows = []
+    for i in range(count):
+        created_at = start + datetime.timedelta(seconds=i, microseconds=rng.choice((0, rng.randrange(1, 10 ** 6))))
+        values = {
+            "title": rng.choice(titles),
+            "url": f"https://example.com/{i}?q={rng.randrange(1000)}",
+            "description": rng.choice((None, "Описание ссылки", "")),
+            "image": rng.choice((None, f"https://example.com/{i}.png")),
+            "type": rng.choice(("website", "book", "article", "music", "video")),
+            "id": i + 1,
+            "user_id": 1,
+            "status": rng.choice(("ready", "pending", "failed")),
+            "created_at": created_at,
+            "updated_at": created_at,
+        }
+        rows.append(tuple(values[field] for field in LINK_FIELDS))
+    return rows
+
+
+def pydantic_path(objects: list, next_cursor) -> bytes:
+    page = LinkPage.model_validate({"items": objects, "next_cursor": next_cursor})
+    return JSONResponse(page.model_dump(mode="json")).body
+
+
+def _timed(func, *args) -> tuple[float, bytes]:
+    started = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - started, result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк сериализации /links/get_links")
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Количество ссылок через запятую")
+    args = parser.parse_args()
+
+    print(f"{'ссылок':>10} {'pydantic, с':>12} {'orjson, с':>10} {'ускорение':>10} {'размер, МБ':>11}")
+    for size in (int(value) for value in args.sizes.split(",")):
+        rows = make_rows(size)
+        objects = [_Attributes(row) for row in rows]
+        next_cursor = "eyJhIjoxfQ"
+        slow, expected = _timed(pydantic_path, objects, next_cursor)
+        fast, actual = _timed(render_link_page, rows, next_cursor)
+        if actual != expected:
+            print(f"{size}: результаты различаются")
+            return 1
+        print(f"{size:>10} {slow:>12.3f} {fast:>10.3f} {slow / fast:>9.1f}x {len(actual) / 2 ** 20:>11.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
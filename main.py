@@ -1,26 +1,61 @@
-import requests
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, Depends
 from fastapi.security import OAuth2PasswordBearer
 
+from app.database import engine, init_db
+from app.hashing import start_hashing_pool, stop_hashing_pool
+from app.email_outbox import start_outbox_worker, stop_outbox_worker
+from app.enrichment import start_enrichment_workers, stop_enrichment_workers
+from app.http_client import start_http_client, close_http_client
+from app.metrics import MetricsMiddleware
+from app.sql_profiling import SQL_PROFILING, SQLProfilingMiddleware, install_sql_profiling
+from app.send_email import close_smtp_pools
 from app.routers.auth import get_current_user
 from app.routers.auth import router as auth_router
-from app.models import Users
+from app.schemas import UserIdentity
 from app.routers.user import router as user_router
 from app.routers.links import routerLinks as links_router
 from app.routers.collections import routerCollections as collection_router
+from app.routers.metrics import routerMetrics as metrics_router
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await start_http_client()
+    start_hashing_pool()
+    await start_enrichment_workers()
+    await start_outbox_worker()
+    try:
+        yield
+    finally:
+        await stop_outbox_worker()
+        await stop_enrichment_workers()
+        await close_http_client()
+        stop_hashing_pool()
+        close_smtp_pools()
+        await engine.dispose()
+
 
 app = FastAPI(
     title="Test",
     version="0.3.1",
+    lifespan=lifespan,
 )
+app.add_middleware(MetricsMiddleware)
+if SQL_PROFILING:
+    install_sql_profiling(engine.sync_engine)
+    app.add_middleware(SQLProfilingMiddleware)
 app.include_router(user_router)
 app.include_router(links_router)
 app.include_router(collection_router)
 app.include_router(auth_router)
+app.include_router(metrics_router)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 @app.get("/me", tags=["Auth"])
-def read_profile(current_user: Users = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
+async def read_profile(current_user: UserIdentity = Depends(get_current_user), token: str = Depends(oauth2_scheme)):
     return {
         'email': current_user.email,
         'access_token': token
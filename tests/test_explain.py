@@ -0,0 +1,287 @@
+"""
+Проверяет, что запросы роутеров используют индексы. Нужен PostgreSQL с актуальной схемой
+(настройки подключения из .env); если БД недоступна, тесты пропускаются.
+
+В одной транзакции добавляется небольшой набор данных и вызываются обработчики роутеров
+и функции приложения, которые работают с БД. Каждый отправленный ими SQL перехватывается
+(before_cursor_execute) и проверяется через EXPLAIN с теми же параметрами, после чего
+транзакция откатывается. Обработчики работают в сессии, привязанной к этой транзакции:
+их commit фиксирует только точку сохранения.
+
+Последовательное сканирование запрещено (enable_seqscan = off), поэтому Seq Scan
+или проход по индексу без условия на его первую колонку означает, что для запроса
+нет подходящего индекса.
+"""
+import asyncio
+import datetime
+import json
+import re
+from contextlib import contextmanager
+
+import pytest
+from fastapi import Request, Response
+from sqlalchemy import event, insert, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import engine, user_exists
+from app.email_outbox import claim_query
+from app.email_verification import create_temp_user, verify_token_and_register
+from app.enrichment import claim_query as enrichment_claim_query
+from app.models import Collections, EmailOutbox, Links, PasswordResetToken, TempUsers, Users, t_collection_links
+from app.pagination import encode_cursor
+from app.routers.collections import export_query as collections_export_query, routerCollections
+from app.routers.links import export_query as links_export_query, routerLinks
+from app.routers.user import router as user_router
+from app.schemas import CollectionLinksBatch, CollectionUpdate, LinkUpdate
+from app.utils import hash_url
+
+USERS = 20
+LINKS_PER_USER = 50
+COLLECTIONS_PER_USER = 5
+OUTBOX_ROWS = 2000
+
+
+async def _seed(conn) -> dict:
+    now = datetime.datetime.utcnow()
+    user_ids = (await conn.execute(
+        insert(Users).returning(Users.id),
+        [{"email": f"explain{i}@example.com", "password_hash": "x"} for i in range(USERS)],
+    )).scalars().all()
+    links = []
+    collections = []
+    for user_id in user_ids:
+        for i in range(LINKS_PER_USER):
+            url = f"https://example.com/{user_id}/{i}"
+            links.append({
+                "user_id": user_id, "title": f"Link {i} python", "url": url, "url_hash": hash_url(url),
+                "description": "explain", "created_at": now, "updated_at": now,
+            })
+        for i in range(COLLECTIONS_PER_USER):
+            collections.append({"user_id": user_id, "name": f"Collection {i}", "created_at": now, "updated_at": now})
+    link_rows = (await conn.execute(insert(Links).returning(Links.id, Links.user_id), links)).all()
+    collection_rows = (await conn.execute(
+        insert(Collections).returning(Collections.id, Collections.user_id), collections
+    )).all()
+
+    first_collection = {}
+    for collection_id, user_id in collection_rows:
+        first_collection.setdefault(user_id, collection_id)
+    await conn.execute(
+        insert(t_collection_links),
+        [{"collection_id": first_collection[user_id], "link_id": link_id} for link_id, user_id in link_rows],
+    )
+    await conn.execute(insert(TempUsers), [
+        {"email": f"explain-temp{i}@example.com", "password_hash": "x", "token": f"explain-temp-{i}",
+         "expires_at": now + datetime.timedelta(minutes=30)} for i in range(USERS)
+    ])
+    await conn.execute(insert(PasswordResetToken), [
+        {"user_id": user_id, "token": f"explain-reset-{user_id}", "expires_at": now + datetime.timedelta(minutes=30)}
+        for user_id in user_ids
+    ])
+    # Большая часть очереди ждёт повторной попытки. На почти пустой таблице планировщик
+    # предпочитает прочитать её целиком, поэтому строк столько, сколько бывает в рабочей очереди
+    await conn.execute(insert(EmailOutbox), [
+        {"email_to": f"explain{i}@example.com", "subject": "explain", "body": "explain",
+         "next_attempt_at": now + datetime.timedelta(seconds=i)} for i in range(OUTBOX_ROWS)
+    ])
+    for table in ("users", "links", "collections", "collection_links", "temp_users", "password_tokens",
+                  "email_outbox"):
+        await conn.execute(text(f"ANALYZE {table}"))
+
+    user_id = user_ids[0]
+    return {
+        "user_id": user_id,
+        "link_ids": [link_id for link_id, owner in link_rows if owner == user_id],
+        "url": f"https://example.com/{user_id}/0",
+        "now": now,
+    }
+
+
+def _endpoint(router, path: str):
+    return next(route.endpoint for route in router.routes if route.path == path)
+
+
+def _calls(seed: dict) -> dict:
+    """
+    Обработчики и функции приложения, SQL которых проверяется. Аргументы передаются явно,
+    как их подставил бы FastAPI. Изменяющие данные вызовы идут после читающих.
+    """
+    user_id = seed["user_id"]
+    url = seed["url"]
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": []})
+    # Курсор на середину списка: вторая страница проверяет условие keyset пагинации
+    cursor = encode_cursor(seed["now"], seed["link_ids"][LINKS_PER_USER // 2])
+    batch = CollectionLinksBatch(urls=[url], link_ids=seed["link_ids"][:10])
+    link = lambda path: _endpoint(routerLinks, f"/links/{path}")
+    collection = lambda path: _endpoint(routerCollections, f"/collections/{path}")
+    user = lambda path: _endpoint(user_router, f"/user/{path}")
+    return {
+        "links: get_links": lambda db: link("get_links")(
+            request=request, user_id=user_id, limit=10, cursor=None, db=db),
+        "links: get_links, следующая страница": lambda db: link("get_links")(
+            request=request, user_id=user_id, limit=10, cursor=cursor, db=db),
+        "links: get_link": lambda db: link("get_link")(user_id=user_id, url=url, db=db),
+        "links: search": lambda db: link("search")(user_id=user_id, q="python", limit=10, cursor=None, db=db),
+        "links: export": lambda db: db.execute(links_export_query(user_id)),
+        "collections: get_collections": lambda db: collection("get_collections")(
+            request=request, response=Response(), user_id=user_id, limit=10, cursor=None, preview=3,
+            include=None, db=db),
+        "collections: get_collections include=links": lambda db: collection("get_collections")(
+            request=request, response=Response(), user_id=user_id, limit=10, cursor=None, preview=3,
+            include="links", db=db),
+        "collections: get_collection": lambda db: collection("get_collection")(
+            user_id=user_id, name="Collection 0", db=db),
+        "collections: export": lambda db: db.execute(collections_export_query(user_id)),
+        "auth: проверка email": lambda db: user_exists(db, "explain0@example.com"),
+        "user: validate-reset-token": lambda db: user("validate-reset-token")(
+            token=f"explain-reset-{user_id}", db=db),
+        "links: update_link": lambda db: link("update_link")(
+            update_data=LinkUpdate(title="explain", type="book"), user_id=user_id, url=url, db=db),
+        "collections: create_collection": lambda db: collection("create_collection")(
+            user_id=user_id, name="Explain", description=None, db=db),
+        "collections: update_collection": lambda db: collection("update_collection")(
+            update_data=CollectionUpdate(description="explain"), user_id=user_id, name="Collection 1", db=db),
+        "collections: add_link": lambda db: collection("add_link")(
+            user_id=user_id, url=url, name="Collection 1", db=db),
+        "collections: remove_link": lambda db: collection("remove_link")(
+            user_id=user_id, url=url, name="Collection 0", db=db),
+        "collections: add_links": lambda db: collection("add_links")(
+            links_data=batch, user_id=user_id, name="Collection 2", db=db),
+        "collections: remove_links": lambda db: collection("remove_links")(
+            links_data=batch, user_id=user_id, name="Collection 0", db=db),
+        "collections: delete_collection": lambda db: collection("delete_collection")(
+            user_id=user_id, name="Collection 4", db=db),
+        "links: delete_link": lambda db: link("delete_link")(user_id=user_id, url=url, db=db),
+        "auth: create_temp_user": lambda db: create_temp_user(db, "explain-new@example.com", "x"),
+        "auth: verify_email": lambda db: verify_token_and_register(db, "explain-temp-1"),
+        "email_outbox: выборка писем": lambda db: db.execute(claim_query()),
+        "enrichment: резервирование ссылок": lambda db: db.execute(enrichment_claim_query(100)),
+    }
+
+
+# Запросы, которые выполняет сам PostgreSQL: каскадное удаление строк collection_links
+# при удалении ссылки (ON DELETE CASCADE), по одному запросу на удалённую ссылку
+TRIGGER_STATEMENTS = {
+    "collection_links: ON DELETE CASCADE": ("DELETE FROM ONLY collection_links WHERE link_id = $1", "link_id"),
+}
+
+
+@contextmanager
+def _capture(statements: list):
+    """Собирает SQL, отправленный в БД внутри блока, вместе с параметрами."""
+    def listener(conn, cursor, statement, parameters, context, executemany):
+        if executemany or statement.lstrip().upper().startswith(("SAVEPOINT", "RELEASE", "ROLLBACK", "SET")):
+            return
+        statements.append((statement, parameters))
+
+    event.listen(engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        yield
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", listener)
+
+
+async def _leading_columns(conn) -> dict[str, str]:
+    """Первая колонка каждого индекса: без условия на неё индекс читается целиком."""
+    rows = await conn.execute(text(
+        "SELECT c.relname, a.attname FROM pg_index i"
+        " JOIN pg_class c ON c.oid = i.indexrelid"
+        " JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]"
+    ))
+    return dict(rows.all())
+
+
+def _full_scans(plan: dict, leading: dict[str, str]) -> list[str]:
+    found = []
+    if plan["Node Type"] == "Seq Scan":
+        found.append(plan["Relation Name"])
+    elif "Index Name" in plan:
+        # При запрете Seq Scan планировщик может выбрать полный проход по неподходящему индексу
+        column = leading.get(plan["Index Name"])
+        if column and not re.search(rf"\b{column}\b", plan.get("Index Cond", "")):
+            found.append(plan.get("Relation Name") or plan["Index Name"])
+    for child in plan.get("Plans", []):
+        found.extend(_full_scans(child, leading))
+    return found
+
+
+async def _explain(conn, statement: str, parameters, leading: dict[str, str]) -> list[str]:
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", tuple(parameters or ()))
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _full_scans(plan[0]["Plan"], leading)
+
+
+# Сколько ждать подключения к БД, прежде чем пропустить тесты
+CONNECT_TIMEOUT = 5
+
+
+class _Unavailable(Exception):
+    pass
+
+
+async def _check() -> dict:
+    """
+    Вызывает обработчики и проверяет их SQL через EXPLAIN.
+    Возвращает ошибки обработчиков и запросы, читающие таблицы целиком.
+    """
+    errors = {}
+    full_scans = {}
+    try:
+        conn = await asyncio.wait_for(engine.connect(), CONNECT_TIMEOUT)
+    except (OSError, asyncio.TimeoutError, DBAPIError) as e:
+        await engine.dispose()
+        raise _Unavailable(str(e) or type(e).__name__)
+    try:
+        transaction = await conn.begin()
+        try:
+            seed = await _seed(conn)
+            leading = await _leading_columns(conn)
+            await conn.execute(text("SET LOCAL enable_seqscan = off"))
+            checks = []
+            async with AsyncSession(bind=conn, join_transaction_mode="create_savepoint",
+                                    autoflush=False, expire_on_commit=False) as db:
+                for name, call in _calls(seed).items():
+                    statements = []
+                    try:
+                        with _capture(statements):
+                            await call(db)
+                    except Exception as e:
+                        errors[name] = getattr(e, "detail", None) or repr(e)
+                        continue
+                    if not statements:
+                        errors[name] = "не выполнил ни одного запроса"
+                    checks.extend((name, statement, parameters) for statement, parameters in statements)
+            for name, (statement, param) in TRIGGER_STATEMENTS.items():
+                checks.append((name, statement, (seed[f"{param}s"][-1],)))
+
+            for name, statement, parameters in checks:
+                tables = await _explain(conn, statement, parameters, leading)
+                if tables:
+                    full_scans.setdefault(name, []).append(
+                        f"{', '.join(sorted(set(tables)))}: {' '.join(statement.split())}"
+                    )
+        finally:
+            await transaction.rollback()
+    finally:
+        await conn.close()
+        await engine.dispose()
+    return {"errors": errors, "full_scans": full_scans}
+
+
+@pytest.fixture(scope="module")
+def explain_results():
+    try:
+        return asyncio.run(_check())
+    except _Unavailable as e:
+        pytest.skip(f"PostgreSQL недоступен: {e}")
+
+
+def test_handlers_run(explain_results):
+    assert explain_results["errors"] == {}
+
+
+def test_no_full_scans(explain_results):
+    assert explain_results["full_scans"] == {}
@@ -0,0 +1,82 @@
+"""
+/links/get_links отдаёт JSON, собранный render_link_page из строк Core запроса через orjson.
+Ответ должен совпадать байт в байт с прежней сериализацией: FastAPI с response_model=LinkPage.
+"""
+import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.models import Links
+from app.routers.links import LINK_FIELDS, render_link_page
+from app.schemas import LinkPage
+
+CREATED = datetime.datetime(2024, 5, 17, 10, 30, 15, 123456)
+# Время без микросекунд: isoformat у pydantic и orjson должен совпадать и в этом случае
+CREATED_WHOLE = datetime.datetime(2024, 5, 17, 10, 30, 15)
+
+
+def _row(**values) -> tuple:
+    row = {
+        "title": "Заголовок",
+        "url": "https://example.com/a",
+        "description": "Описание",
+        "image": "https://example.com/a.png",
+        "type": "website",
+        "id": 1,
+        "user_id": 1,
+        "status": "ready",
+        "created_at": CREATED,
+        "updated_at": CREATED,
+        **values,
+    }
+    return tuple(row[field] for field in LINK_FIELDS)
+
+
+class _Link:
+    """Объект с атрибутами строки, как ORM объект Links, который раньше возвращал обработчик."""
+
+    def __init__(self, row: tuple):
+        for field, value in zip(LINK_FIELDS, row):
+            setattr(self, field, value)
+
+
+def _previous_body(rows: list, next_cursor) -> bytes:
+    app = FastAPI()
+
+    @app.get("/", response_model=LinkPage)
+    def page():
+        return {"items": [_Link(row) for row in rows], "next_cursor": next_cursor}
+
+    with TestClient(app) as client:
+        return client.get("/").content
+
+
+CASES = {
+    "ascii": [_row(title="plain", description="text")],
+    "не ascii": [_row(title="Заголовок «страницы» — 🚀", description="Описание ñ 中文")],
+    "спецсимволы": [_row(title='"кавычки" \\ слеш\tтаб\nперенос ', url="https://example.com/?a=1&b=<2>")],
+    "null": [_row(description=None, image=None)],
+    "пустые строки": [_row(title="", description="", image="")],
+    "время без микросекунд": [_row(created_at=CREATED_WHOLE, updated_at=CREATED_WHOLE)],
+    "время с микросекундами": [_row(created_at=CREATED.replace(microsecond=1), updated_at=CREATED)],
+    "несколько строк": [
+        _row(id=3, status="pending", type="book", created_at=CREATED_WHOLE),
+        _row(id=2, status="failed", description=None, type="video"),
+        _row(id=1, title="Ещё одна"),
+    ],
+    "пустая страница": [],
+}
+
+
+@pytest.mark.parametrize("next_cursor", [None, "WyIyMDI0LTA1LTE3VDEwOjMwOjE1IiwgMV0"])
+@pytest.mark.parametrize("rows", CASES.values(), ids=CASES.keys())
+def test_render_link_page_matches_response_model(rows, next_cursor):
+    assert render_link_page(rows, next_cursor) == _previous_body(rows, next_cursor)
+
+
+def test_title_is_not_nullable():
+    # Title в схеме Link обязателен, поэтому NULL в заголовке не может попасть в ответ
+    # ни одним из способов: колонка объявлена NOT NULL
+    assert not Links.__table__.c.title.nullable
@@ -0,0 +1,177 @@
+"""
+Тесты пула SMTP соединений с локальным SMTP сервером aiosmtpd вместо настоящего.
+
+    pip install pytest aiosmtpd
+    python -m pytest tests
+"""
+import asyncio
+import smtplib
+import socket
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+
+from app import send_email
+from app.send_email import SMTPPool, build_message
+
+REJECTED = "rejected@example.com"
+
+
+class _Handler:
+    def __init__(self):
+        self.messages = []
+        # Объект session у aiosmtpd свой для каждого SMTP соединения
+        self.sessions = []
+
+    async def handle_RCPT(self, server, session, envelope, address, rcpt_options):
+        if address == REJECTED:
+            return "550 Mailbox unavailable"
+        envelope.rcpt_tos.append(address)
+        return "250 OK"
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope.rcpt_tos[:])
+        if session not in self.sessions:
+            self.sessions.append(session)
+        return "250 Message accepted"
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class _Server:
+    """Локальный SMTP сервер, который можно перезапустить на том же порту."""
+
+    def __init__(self):
+        self.handler = _Handler()
+        self.hostname = "127.0.0.1"
+        self.port = _free_port()
+        self.controller = None
+
+    def start(self):
+        self.controller = Controller(self.handler, hostname=self.hostname, port=self.port)
+        self.controller.start()
+
+    def stop(self):
+        self.controller.stop()
+
+    def restart(self):
+        # Сервер закрывает все открытые соединения
+        self.stop()
+        self.start()
+
+
+@pytest.fixture
+def smtp_server(monkeypatch):
+    monkeypatch.setattr(send_email, "SMTP_STARTTLS", False)
+    server = _Server()
+    server.start()
+    yield server
+    server.stop()
+
+
+def _pool(server: _Server, **kwargs) -> SMTPPool:
+    return SMTPPool("sender@example.com", "", host=server.hostname, port=server.port, size=1, **kwargs)
+
+
+def _message(email_to="user@example.com"):
+    return build_message("sender@example.com", email_to, "Тема", "Текст письма")
+
+
+def test_connection_is_reused(smtp_server):
+    handler = smtp_server.handler
+    pool = _pool(smtp_server)
+
+    for _ in range(3):
+        pool.send(_message())
+    pool.close()
+
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 1
+    assert pool.stats()["connects"] == 1
+    assert pool.stats()["sent"] == 3
+
+
+def test_connection_is_recreated_after_max_messages(smtp_server):
+    handler = smtp_server.handler
+    pool = _pool(smtp_server, max_messages=2)
+
+    for _ in range(3):
+        pool.send(_message())
+    pool.close()
+
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 2
+    assert pool.stats()["connects"] == 2
+
+
+def test_reconnect_after_server_drops_connection(smtp_server):
+    handler = smtp_server.handler
+    pool = _pool(smtp_server)
+    pool.send(_message())
+
+    smtp_server.restart()
+    pool.send(_message())
+    pool.close()
+
+    assert len(handler.messages) == 2
+    assert len(handler.sessions) == 2
+    stats = pool.stats()
+    assert stats["reconnects"] == 1
+    assert stats["sent"] == 2
+    assert stats["failed"] == 0
+
+
+def test_idle_connection_is_checked_with_noop(smtp_server, monkeypatch):
+    handler = smtp_server.handler
+    monkeypatch.setattr(send_email, "SMTP_IDLE_CHECK", 0)
+    pool = _pool(smtp_server)
+
+    pool.send(_message())
+    pool.send(_message())
+    # NOOP на оборванном соединении не проходит: письмо уходит через новое без повторной отправки
+    smtp_server.restart()
+    pool.send(_message())
+    pool.close()
+
+    assert len(handler.messages) == 3
+    assert len(handler.sessions) == 2
+    stats = pool.stats()
+    assert stats["connects"] == 2
+    assert stats["reconnects"] == 0
+
+
+def test_rejected_recipient_keeps_connection(smtp_server):
+    handler = smtp_server.handler
+    pool = _pool(smtp_server)
+
+    with pytest.raises(smtplib.SMTPRecipientsRefused):
+        pool.send(_message(REJECTED))
+    pool.send(_message())
+    pool.close()
+
+    assert handler.messages == [["user@example.com"]]
+    stats = pool.stats()
+    assert stats["failed"] == 1
+    assert stats["connects"] == 1
+
+
+def test_send_async(smtp_server):
+    handler = smtp_server.handler
+    pool = _pool(smtp_server)
+
+    async def send_both():
+        await pool.send_async(_message())
+        await pool.send_async(_message())
+
+    asyncio.run(send_both())
+    pool.close()
+
+    assert len(handler.messages) == 2
+    assert len(handler.sessions) == 1
+    assert pool.stats()["sent"] == 2